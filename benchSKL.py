@@ -0,0 +1,106 @@
+#!/bin/python3
+# ##### BEGIN GPL LICENSE BLOCK ##### #
+# lolblender - Python addon to use League of Legends files into blender
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Headless benchmark of the .skl parser.  For every file it reports the
+# read and seek calls readSKL makes on an unbuffered file, so each one is a
+# syscall, and the average parse time with normal buffering.
+#
+#   python3 benchSKL.py [-n 100] path/to/*.skl
+
+# <pep8 compliant>
+import contextlib
+import io
+import timeit
+
+from io_scene_lol import lolSkeleton
+
+
+class countingFile(io.FileIO):
+    """Unbuffered file that counts the calls that reach the OS"""
+
+    def __init__(self, *args, **kwargs):
+        io.FileIO.__init__(self, *args, **kwargs)
+        self.numReads = 0
+        self.numSeeks = 0
+        self.numBytes = 0
+
+    def read(self, size=-1):
+        data = io.FileIO.read(self, size)
+        self.numReads += 1
+        self.numBytes += len(data)
+        return data
+
+    def readall(self):
+        data = io.FileIO.readall(self)
+        self.numReads += 1
+        self.numBytes += len(data)
+        return data
+
+    def readinto(self, buf):
+        numBytes = io.FileIO.readinto(self, buf)
+        self.numReads += 1
+        self.numBytes += numBytes
+        return numBytes
+
+    def seek(self, offset, whence=0):
+        self.numSeeks += 1
+        return io.FileIO.seek(self, offset, whence)
+
+
+def countCalls(filepath):
+    """Parses filepath once through a countingFile, returns the file"""
+    files = []
+
+    def countingOpen(path, mode='rb'):
+        files.append(countingFile(path, 'r'))
+        return files[-1]
+
+    # readSKL looks open up in its module globals first
+    lolSkeleton.open = countingOpen
+    try:
+        lolSkeleton.readSKL(filepath)
+    finally:
+        del lolSkeleton.open
+    return files[0]
+
+
+def benchSKL(filepath, number=100):
+    """Returns (version, numBones, counting file, seconds per parse)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        counts = countCalls(filepath)
+        skeleton = lolSkeleton.readSKL(filepath)
+        seconds = timeit.timeit(lambda: lolSkeleton.readSKL(filepath), number=number) / number
+    return skeleton.header.version, len(skeleton), counts, seconds
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options] file.skl ...")
+    parser.add_option("-n", "--number", dest="number", help="parses to time per file",
+            default=100, action="store", type="int")
+    (options, args) = parser.parse_args()
+    if not args:
+        parser.error("Enter one or more .skl files")
+
+    print("%-40s %7s %5s %5s %5s %8s %10s" % ("file", "version", "bones",
+            "reads", "seeks", "bytes", "ms/parse"))
+    for filepath in args:
+        (version, numBones, counts, seconds) = benchSKL(filepath, options.number)
+        print("%-40s %7d %5d %5d %5d %8d %10.3f" % (filepath[-40:], version, numBones,
+                counts.numReads, counts.numSeeks, counts.numBytes, seconds * 1000.0))
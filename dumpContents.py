@@ -20,12 +20,12 @@
 from io_scene_lol import lolMesh, lolSkeleton
 def prettyPrintSkl(filename, start=0, stop=-1, returnStr=True, **options):
     
-    header, boneList = lolSkeleton.importSKL(filename)
+    header, boneList, reorderedBoneList = lolSkeleton.importSKL(filename)
     headerStr = ""
     if(options['PRINT_HEADER']): 
         headerStr += \
-        "Filetype:%s\nnumObjects:%d\nskeletonHash:%d\nnumElements:%d\n\n" % (header.fileType, 
-                header.numObjects, header.skeletonHash, header.numElements)
+        "Filetype:%s\nversion:%d\nskeletonHash:%s\nnumBones:%d\n\n" % (header.fileType, 
+                header.version, header.skeletonHash, header.numBones)
     boneStr = ""
     if(options['PRINT_BONES']):
         if stop == -1:
@@ -52,31 +52,33 @@ def prettyPrintSkl(filename, start=0, stop=-1, returnStr=True, **options):
     else:
         print(headerStr+boneStr)
 
-def prettyPrintSkn(filename, start=0, end=-1, returnStr = True, **options):
-    header, materials, indices, vertices = lolMesh.importSKN(filename)
+def prettyPrintSkn(filename, start=0, stop=-1, returnStr = True, **options):
+    header, materials, metaData, indices, vertices = lolMesh.importSKN(filename)
     headerStr = ""
     if(options['PRINT_HEADER']):
-        headerStr += "magic:%d\nmatHeader:%d\nnumObjects:%d\nnumMaterials:%d\n\n" % (header.magic, 
-            header.matHeader, header.numObjects, len(materials)) 
+        headerStr += "magic:%d\nversion:%d\nnumObjects:%d\nnumMaterials:%d\n\n" % (header.magic, 
+            header.version, header.numObjects, len(materials)) 
 
     materialStr = ""
     if(options['PRINT_MATERIALS']):
-        if header.matHeader == 0:
+        if header.version == 0:
             materialStr +="No material blocks present\n\n"
         else:
             for material in materials:
                 materialStr += \
                 "name:%s\nstartVertex:%d\tnumVertices:%d\nstartIndex:%d\tnumIndices:%d\n\n" %\
-                (bytes.decode(material.name).strip('\x00'),material.startVertex, \
+                (material.name,material.startVertex, \
                 material.numVertices, material.startIndex, material.numIndices)
 
     indexStr = ""
     if(options['PRINT_INDICES']):
         for indx in indices:
-            indexStr += "%d\n" %(indx[0],)
+            indexStr += "%d\n" %(indx,)
 
     vertexStr = ""
     if(options['PRINT_VERTICES']):
+        if stop == -1:
+            stop = len(vertices)
         for indx, vtx in enumerate(vertices[start:stop]):
             vertexStr += \
                 "%d\tpos:(%f,%f,%f)\tboneIndx:(%d,%d,%d,%d)\n"%(start+indx, 
@@ -93,23 +95,23 @@ def prettyPrintSkn(filename, start=0, end=-1, returnStr = True, **options):
     else:
         print(headerStr+materialStr+indexStr+vertexStr)
 
-def cvsPrintSkl(filename, start=0, end=-1, returnStr=True, **options):
+def cvsPrintSkl(filename, start=0, stop=-1, returnStr=True, **options):
     
-    header, boneList = lolSkeleton.importSKL(filename)
+    header, boneList, reorderedBoneList = lolSkeleton.importSKL(filename)
     headerStr = ""
     if(options['PRINT_HEADER']): 
-        headerStr += "#fileType, numObjects, skeletonHash, numElements\n"
+        headerStr += "#fileType, version, skeletonHash, numBones\n"
         headerStr += \
-        "%s,%d,%d,%d\n" % (header.fileType, 
-                header.numObjects, header.skeletonHash, header.numElements)
+        "%s,%d,%s,%d\n" % (header.fileType, 
+                header.version, header.skeletonHash, header.numBones)
     boneStr = ""
     if(options['PRINT_BONES']):
         boneStr+="#boneID, name, parentID, scale,"
         boneStr+="matrix[0][0], matrix[0][1], matrix[0][2], matrix[0][3],"
         boneStr+="matrix[1][0], matrix[1][1], matrix[1][2], matrix[1][3],"
         boneStr+="matrix[2][0], matrix[2][1], matrix[2][2], matrix[2][3]\n"
-        if end == -1:
-            end = len(boneList)
+        if stop == -1:
+            stop = len(boneList)
         for id in range(start,stop):
             bone = boneList[id]
             if bone.parent != -1:
@@ -131,13 +133,13 @@ def cvsPrintSkl(filename, start=0, end=-1, returnStr=True, **options):
     else:
         print(headerStr+boneStr)
 
-def cvsPrintSkn(filename, start=0, end=-1, returnStr = True, **options):
-    header, materials, indices, vertices = lolMesh.importSKN(filename)
+def cvsPrintSkn(filename, start=0, stop=-1, returnStr = True, **options):
+    header, materials, metaData, indices, vertices = lolMesh.importSKN(filename)
     headerStr = ""
     if(options['PRINT_HEADER']):
-        headerStr+="#magic, matHeader, numObjects\n"
-        headerStr += "%d,%d,%d\n" % (header['magic'], 
-            header['matHeader'], header['numObjects']) 
+        headerStr+="#magic, version, numObjects\n"
+        headerStr += "%d,%d,%d\n" % (header.magic, 
+            header.version, header.numObjects) 
 
     materialStr = ""
     if(options['PRINT_MATERIALS']):
@@ -146,14 +148,14 @@ def cvsPrintSkn(filename, start=0, end=-1, returnStr = True, **options):
         for material in materials:
             materialStr += \
             "%d,%s,%d,%d,%d,%d\n" %\
-            (material['numMaterials'], bytes.decode(material['name']).strip('\x00'),material['startVertex'], \
-            material['numVertices'], material['startIndex'], material['numIndices'])
+            (header.numMaterials, material.name,material.startVertex, \
+            material.numVertices, material.startIndex, material.numIndices)
 
     indexStr = ""
     if(options['PRINT_INDICES']):
         indexStr+="#Index list"
         for indx in indices:
-            indexStr += "%d," %(indx[0],)
+            indexStr += "%d," %(indx,)
 
         indexStr+="\n"
 
@@ -164,16 +166,18 @@ def cvsPrintSkn(filename, start=0, end=-1, returnStr = True, **options):
         vertexStr+="norm_x, norm_y, norm_z,"
         vertexStr+="boneWeight_0, boneWeight_1, boneWeight_2, boneWeight_3,"
         vertexStr+="uv_u, uv_v\n"
+        if stop == -1:
+            stop = len(vertices)
         for indx, vtx in enumerate(vertices[start:stop]):
             vertexStr += \
                 "%d,%f,%f,%f,%d,%d,%d,%d,"%(start+indx, 
-                    vtx['position'][0], vtx['position'][1],vtx['position'][2],
-                    vtx['boneIndex'][0],vtx['boneIndex'][1],vtx['boneIndex'][2],vtx['boneIndex'][3])
+                    vtx.position[0], vtx.position[1],vtx.position[2],
+                    vtx.boneIndex[0],vtx.boneIndex[1],vtx.boneIndex[2],vtx.boneIndex[3])
             vertexStr += \
                 "%f,%f,%f,%f,%f,%f,%f,"%\
-                (vtx['normal'][0],vtx['normal'][1],vtx['normal'][2],\
-                vtx['weights'][0],vtx['weights'][1],vtx['weights'][2],vtx['weights'][3])
-            vertexStr += "%f,%f\n"%(vtx['texcoords'][0],vtx['texcoords'][1])
+                (vtx.normal[0],vtx.normal[1],vtx.normal[2],\
+                vtx.weights[0],vtx.weights[1],vtx.weights[2],vtx.weights[3])
+            vertexStr += "%f,%f\n"%(vtx.texcoords[0],vtx.texcoords[1])
 
     if returnStr == True:
         return headerStr+materialStr+indexStr+vertexStr
@@ -20,7 +20,7 @@
 import bpy
 from bpy import props
 from bpy_extras.io_utils import ImportHelper, ExportHelper
-from . import lolMesh, lolSkeleton, lolAnimation
+from . import lolMesh, lolSkeleton, lolAnimation, lolCache
 from os import path
 
 __bpydoc__="""
@@ -38,6 +38,11 @@ class IMPORT_OT_lol(bpy.types.Operator, ImportHelper):
     MODEL_DIR : props.StringProperty()
     CLEAR_SCENE : props.BoolProperty(name='ClearScene', description='Clear current scene before importing?', default=True)
     APPLY_WEIGHTS : props.BoolProperty(name='LoadWeights', description='Load default bone weights from .skn file', default=True)
+    WEIGHT_METHOD : props.EnumProperty(name='Weight Method', description='How bone weights are written to the vertex groups',
+            items=[('AUTO', 'Auto', 'Pick the faster method for the weights in the file'),
+                   ('DEFORM_LAYER', 'Deform Layer', 'Write every weight into the bmesh deform layer'),
+                   ('VERTEX_GROUPS', 'Vertex Groups', 'One vertex group add call per bone and weight')],
+            default='AUTO')
     
        
     def draw(self, context):
@@ -58,6 +63,7 @@ class IMPORT_OT_lol(bpy.types.Operator, ImportHelper):
         box.prop(self.properties, 'DDS_FILE')
         box.prop(self.properties, 'CLEAR_SCENE', text='Clear scene before importing')
         box.prop(self.properties, 'APPLY_WEIGHTS', text='Load mesh weights')
+        box.prop(self.properties, 'WEIGHT_METHOD')
         
     def execute(self, context):
         
@@ -66,7 +72,8 @@ class IMPORT_OT_lol(bpy.types.Operator, ImportHelper):
                     SKL_FILE=self.SKL_FILE,
                     DDS_FILE=self.DDS_FILE,
                     CLEAR_SCENE=self.CLEAR_SCENE,
-                    APPLY_WEIGHTS=self.APPLY_WEIGHTS)
+                    APPLY_WEIGHTS=self.APPLY_WEIGHTS,
+                    WEIGHT_METHOD=self.WEIGHT_METHOD)
                
         return {'FINISHED'}
 
@@ -137,6 +144,13 @@ class EXPORT_OT_lol(bpy.types.Operator, ExportHelper):
     OUTPUT_FILE : props.StringProperty(name='Export File', description='File to which model will be exported')
     BASE_ON_IMPORT : props.BoolProperty(name='Base On Imported SKN', description='Base writing on an imported SKN of choice', default=True)
     INPUT_FILE : props.StringProperty(name='Import File', description='File to import certain metadata from')
+    USE_32BIT_INDICES : props.BoolProperty(name='32 Bit Indices', description='Write 32 bit indices for meshes with more than 65536 vertices (version 4 only)', default=False)
+    POSITION_TOLERANCE : props.FloatProperty(name='Position Tolerance', description='Merge split vertices whose positions are this close (0 = exact)', default=0.0, min=0.0, precision=6)
+    UV_TOLERANCE : props.FloatProperty(name='UV Tolerance', description='Merge split vertices whose UVs are this close (0 = exact)', default=0.0, min=0.0, precision=6)
+    WEIGHT_THRESHOLD : props.FloatProperty(name='Weight Threshold', description='Drop bone influences with a smaller weight', default=0.0, min=0.0, max=1.0)
+    QUANTIZE_WEIGHTS : props.BoolProperty(name='Quantize Weights', description='Snap bone weights to 8 bit steps', default=False)
+    OPTIMIZE_VERTEX_CACHE : props.BoolProperty(name='Optimize Vertex Cache', description='Reorder triangles and vertices for better GPU vertex cache use', default=False)
+    APPLY_MODIFIERS : props.BoolProperty(name='Apply Modifiers', description='Export the mesh after modifiers. This includes the pose of an armature modifier', default=False)
     MODEL_DIR : props.StringProperty()
 
     filename_ext = '.skn'
@@ -154,13 +168,27 @@ class EXPORT_OT_lol(bpy.types.Operator, ExportHelper):
         box.prop(self.properties, 'OUTPUT_FILE')
         box.prop(self.properties, 'BASE_ON_IMPORT')
         box.prop(self.properties, 'INPUT_FILE')
+        box.prop(self.properties, 'USE_32BIT_INDICES')
+        box.prop(self.properties, 'POSITION_TOLERANCE')
+        box.prop(self.properties, 'UV_TOLERANCE')
+        box.prop(self.properties, 'WEIGHT_THRESHOLD')
+        box.prop(self.properties, 'QUANTIZE_WEIGHTS')
+        box.prop(self.properties, 'OPTIMIZE_VERTEX_CACHE')
+        box.prop(self.properties, 'APPLY_MODIFIERS')
         
     def execute(self, context):
         export_char(MODEL_DIR=self.MODEL_DIR,
                 OUTPUT_FILE=self.OUTPUT_FILE,
                 INPUT_FILE=self.INPUT_FILE,
                 BASE_ON_IMPORT=self.BASE_ON_IMPORT,
-                VERSION=self.VERSION)
+                VERSION=self.VERSION,
+                USE_32BIT_INDICES=self.USE_32BIT_INDICES,
+                POSITION_TOLERANCE=self.POSITION_TOLERANCE,
+                UV_TOLERANCE=self.UV_TOLERANCE,
+                WEIGHT_THRESHOLD=self.WEIGHT_THRESHOLD,
+                QUANTIZE_WEIGHTS=self.QUANTIZE_WEIGHTS,
+                OPTIMIZE_VERTEX_CACHE=self.OPTIMIZE_VERTEX_CACHE,
+                APPLY_MODIFIERS=self.APPLY_MODIFIERS)
 
         return {'FINISHED'}
         
@@ -223,7 +251,8 @@ class EXPORT_OT_sco(bpy.types.Operator, ExportHelper): #BilbozZ Class
         return result
 
 def import_char(MODEL_DIR="", SKN_FILE="", SKL_FILE="", DDS_FILE="",
-        CLEAR_SCENE=True, APPLY_WEIGHTS=True, APPLY_TEXTURE=True):
+        CLEAR_SCENE=True, APPLY_WEIGHTS=True, APPLY_TEXTURE=True,
+        WEIGHT_METHOD='AUTO'):
     '''Import a LoL Character
     MODEL_DIR:  Base directory of the model you wish to import.
     SKN_FILE:  .skn mesh file for the character
@@ -233,6 +262,8 @@ def import_char(MODEL_DIR="", SKN_FILE="", SKL_FILE="", DDS_FILE="",
                  before importing
     APPLY_WEIGHTS:  Import bone weights from the mesh file
     APPLY_TEXTURE:  Apply the skin texture
+    WEIGHT_METHOD:  'AUTO', 'DEFORM_LAYER' or 'VERTEX_GROUPS', how the
+                    weights are written (see lolMesh.addDefaultWeights)
 
     !!IMPORTANT!!:
     If you're running this on a windows system make sure
@@ -250,7 +281,7 @@ def import_char(MODEL_DIR="", SKN_FILE="", SKL_FILE="", DDS_FILE="",
     if SKL_FILE:
         SKL_FILEPATH=path.join(MODEL_DIR, SKL_FILE)
         #sklHeader, boneDict = lolSkeleton.importSKL(SKL_FILEPATH)
-        sklHeader, boneList, reorderedBoneList = lolSkeleton.importSKL(SKL_FILEPATH)
+        sklHeader, boneList, reorderedBoneList = lolCache.cachedParse(SKL_FILEPATH, lolSkeleton.importSKL)
         lolSkeleton.buildSKL(boneList, sklHeader.version)
         armObj = bpy.data.objects['Armature']
         armObj.name ='lolArmature'
@@ -260,8 +291,8 @@ def import_char(MODEL_DIR="", SKN_FILE="", SKL_FILE="", DDS_FILE="",
 
     if SKN_FILE:
         SKN_FILEPATH=path.join(MODEL_DIR, SKN_FILE)
-        sknHeader, materials, metaData, indices, vertices = lolMesh.importSKN(SKN_FILEPATH)
-        lolMesh.buildMesh(SKN_FILEPATH)
+        sknMesh = lolCache.cachedParse(SKN_FILEPATH, lolMesh.readSKN)
+        lolMesh.buildMesh(SKN_FILEPATH, sknMesh)
         meshObj = bpy.data.objects['lolMesh']
         bpy.ops.object.select_all(action='DESELECT')
         meshObj.select_set(True)
@@ -274,11 +305,12 @@ def import_char(MODEL_DIR="", SKN_FILE="", SKL_FILE="", DDS_FILE="",
         #    vtx.normal = vertices[id]['normal']
         
     if SKN_FILE and SKL_FILE and APPLY_WEIGHTS:
-        if reorderedBoneList == []:
-           lolMesh.addDefaultWeights(boneList, vertices, armObj, meshObj)
+        useDeformLayer = {'AUTO': None, 'DEFORM_LAYER': True, 'VERTEX_GROUPS': False}[WEIGHT_METHOD]
+        if len(reorderedBoneList) == 0:
+           lolMesh.addDefaultWeights(boneList, sknMesh, armObj, meshObj, useDeformLayer)
         else:
            print('Using reordered Bone List')
-           lolMesh.addDefaultWeights(reorderedBoneList, vertices, armObj, meshObj)
+           lolMesh.addDefaultWeights(reorderedBoneList, sknMesh, armObj, meshObj, useDeformLayer)
 
     if DDS_FILE and APPLY_TEXTURE:
         DDS_FILEPATH=path.join(MODEL_DIR, DDS_FILE)
@@ -288,11 +320,14 @@ def import_char(MODEL_DIR="", SKN_FILE="", SKL_FILE="", DDS_FILE="",
             pass
         bpy.ops.object.select_all(action='DESELECT')
 
+        # one image datablock, shared by every material's texture node
+        img = lolCache.loadImage(DDS_FILEPATH)
+        img.source = 'FILE'
+        img.alpha_mode = 'NONE'   #BilbozZ
         for matSlot in meshObj.material_slots:
-            img = bpy.data.images.load(DDS_FILEPATH)
-            img.source = 'FILE'
-            img.use_alpha = False   #BilbozZ
-            matSlot.material.texture_slots[0].texture.image = img
+            for node in matSlot.material.node_tree.nodes:
+                if node.type == 'TEX_IMAGE':
+                    node.image = img
 
 def import_animation(MODEL_DIR="", ANM_FILE=""):
     '''Import an Animation for a LoL character
@@ -303,7 +338,7 @@ def import_animation(MODEL_DIR="", ANM_FILE=""):
     if ANM_FILE:
         ANM_FILEPATH=path.join(MODEL_DIR, ANM_FILE)
 
-    animationHeader, boneList = lolAnimation.importANM(ANM_FILEPATH)
+    animationHeader, boneList = lolCache.cachedParse(ANM_FILEPATH, lolAnimation.importANM)
     lolAnimation.applyANM(animationHeader, boneList)
 
 def export_animation(MODEL_DIR='', OUTPUT_FILE='untitled.anm', INPUT_FILE='', OVERWRITE_FILE_VERSION=False, VERSION=3):
@@ -323,7 +358,14 @@ def export_char(MODEL_DIR='',
                 OUTPUT_FILE='untitled.skn',
                 INPUT_FILE='',
                 BASE_ON_IMPORT=False,
-                VERSION=2):
+                VERSION=2,
+                USE_32BIT_INDICES=False,
+                POSITION_TOLERANCE=0.0,
+                UV_TOLERANCE=0.0,
+                WEIGHT_THRESHOLD=0.0,
+                QUANTIZE_WEIGHTS=False,
+                OPTIMIZE_VERTEX_CACHE=False,
+                APPLY_MODIFIERS=False):
     '''Exports a mesh as a LoL .skn file.
 
     MODEL_DIR:      Base directory of the input and output file.
@@ -331,6 +373,13 @@ def export_char(MODEL_DIR='',
     INPUT_FILE:     Name of the file from which certain meta-data will be taken
     BASE_ON_IMPORT: Indicator on whether to take metadata from INPUT_FILE
     VERSION:        Version of the SKN we will be making
+    USE_32BIT_INDICES: Write 32 bit indices (version 4 only)
+    POSITION_TOLERANCE: Merge split vertices closer than this (0 = exact)
+    UV_TOLERANCE:   Merge split vertices whose UVs are closer than this
+    WEIGHT_THRESHOLD: Drop bone influences with a smaller weight
+    QUANTIZE_WEIGHTS: Snap bone weights to 8 bit steps
+    OPTIMIZE_VERTEX_CACHE: Reorder triangles and vertices for the GPU vertex cache
+    APPLY_MODIFIERS: Export the mesh with its modifiers applied
     '''
     import bpy
 
@@ -358,7 +407,9 @@ def export_char(MODEL_DIR='',
     # left over from previous export trials, probably
     # bpy.ops.transform.resize(value=(1,1,-1), constraint_axis=(False, False,
     #         True), constraint_orientation='GLOBAL')
-    lolMesh.exportSKN(meshObj, output_filepath, input_filepath, BASE_ON_IMPORT, VERSION)
+    lolMesh.exportSKN(meshObj, output_filepath, input_filepath, BASE_ON_IMPORT, VERSION, USE_32BIT_INDICES,
+            POSITION_TOLERANCE, UV_TOLERANCE, WEIGHT_THRESHOLD, QUANTIZE_WEIGHTS, OPTIMIZE_VERTEX_CACHE,
+            APPLY_MODIFIERS)
     # bpy.ops.transform.resize(value=(1,1,-1), constraint_axis=(False, False,
     #         True), constraint_orientation='GLOBAL')
 
@@ -25,8 +25,14 @@
 # and this file makes use of that work
 
 # <pep8 compliant>
+import copy
+import os
 import struct
-import mathutils
+from collections import namedtuple
+
+import numpy as np
+
+from . import lolCache, lolMath, lolSkeleton
 
 class anmHeader():
     """LoL animation header format:
@@ -91,20 +97,22 @@ class anmHeader():
         self.numFrames = None
         self.playbackFPS = None
 
-    def fromFile(self, anmFile):
+    def fromFile(self, anmFile, verbose=True):
         """Reads the skl header object from the raw binary file"""
         anmFile.seek(0)
         beginning = struct.unpack(self.__format__i, anmFile.read(self.__size__i))
         (self.id, self.version) = beginning
 
-        print("ANM Version: %d" % self.version)
+        if verbose:
+            print("ANM Version: %d" % self.version)
         if self.version in [0, 2, 3]:  # versions 0-3
             rest = struct.unpack(self.__format__v023, anmFile.read(self.__size__v023))
             (self.magic, self.numBones, self.numFrames, self.playbackFPS) = rest
-            print("anmMagic: %s" % self.magic)
-            print("anmNumBones: %s" % self.numBones)
-            print("anmnumFrames: %s" % self.numFrames)
-            print("anmplaybackFPS: %s" % self.playbackFPS)
+            if verbose:
+                print("anmMagic: %s" % self.magic)
+                print("anmNumBones: %s" % self.numBones)
+                print("anmnumFrames: %s" % self.numFrames)
+                print("anmplaybackFPS: %s" % self.playbackFPS)
         elif self.version == 1:  # version 1
             rest = struct.unpack(self.__format__v1, anmFile.read(self.__size__v1))
             (self.magic, self.numBones, self.offset, self.numFrames, 
@@ -129,8 +137,9 @@ class anmHeader():
             self.offsets2 = rest[13:16]
         else:
             raise ValueError("Version %s ANM not supported" % self.version)
-        print("Version: %s" % self.version)
-        print("magic: %s" % self.magic)
+        if verbose:
+            print("Version: %s" % self.version)
+            print("magic: %s" % self.magic)
     
     def toFile(self, anmFile):
         """Writes the header object to a raw binary file"""
@@ -189,38 +198,47 @@ class anmBone():
         else:
             raise ValueError("Unhandled Bone version number", version)
 
-    def frameDataFromFile(self, anmFile, version):
-        """Reads animation bone frame data from a binary file fid"""
+    def frameDataFromFile(self, anmFile, version, numFrames=1):
+        """Reads numFrames frames of animation bone data from a binary file
+        fid with one read.  Frames are appended to the (F, 3) positions and
+        (F, 4) w, x, y, z orientations arrays, with z flipped."""
         if version in [0,2,3]:
-            fields = struct.unpack(self.__format__f,
-                    anmFile.read(self.__size__f))
-            orientation = mathutils.Quaternion([-fields[3], fields[0],
-                    fields[1], -fields[2]])
-            # orientation = mathutils.Quaternion(fields[0:4])
-            position = mathutils.Vector(fields[4:7])
-            position.z *= -1
-            self.add_frame(position, orientation)
+            buf = anmFile.read(self.__size__f * numFrames)
+            if len(buf) != self.__size__f * numFrames:
+                raise ValueError("Unexpected end of file while reading %d frames" % numFrames)
+            fields = np.frombuffer(buf, dtype='<f4').reshape(-1, 7)
+            orientations = fields[:, [3, 0, 1, 2]] * np.float32([-1, 1, 1, -1])
+            positions = fields[:, 4:7] * np.float32([1, 1, -1])
+            self.orientations = np.concatenate((np.reshape(self.orientations,
+                    (-1, 4)), orientations)).astype(np.float32)
+            self.positions = np.concatenate((np.reshape(self.positions,
+                    (-1, 3)), positions)).astype(np.float32)
         else:
             raise ValueError("Unhandled Bone version number", version)
 
     def add_frame(self, position, orientation):
-        """Adds a position Vector and orientation Quaternion to this bone's
-        lists, representing a new frame."""
+        """Adds a position and w, x, y, z orientation to this bone's lists,
+        representing a new frame."""
+        if not isinstance(self.positions, list):
+            self.positions = list(self.positions)
+            self.orientations = list(self.orientations)
         self.positions.append(position)
         self.orientations.append(orientation)
 
     def get_frame(self, frame_number):
-        """Returns the position Vector and orientation Quaternion of a bone
-        in a given frame."""
+        """Returns the position and w, x, y, z orientation of a bone in a
+        given frame."""
         return self.positions[frame_number], self.orientations[frame_number]
 
     def toFile(self, anmFile, version):
         """Writes animation bone object to a binary file FID"""
         if version in [0,2,3]:
             data = struct.pack(self.__format__i, self.name.encode(), self.unknown)
-            for j in range(0, len(self.orientations)):
-                data += struct.pack(self.__format__f, self.orientations[j][1], self.orientations[j][2], -self.orientations[j][3], -self.orientations[j][0], self.positions[j][0], self.positions[j][1], self.positions[j][2])
-            anmFile.write(data)
+            orientations = np.asarray(self.orientations, dtype=np.float32).reshape(-1, 4)
+            positions = np.asarray(self.positions, dtype=np.float32).reshape(-1, 3)
+            frames = np.column_stack((orientations[:, 1], orientations[:, 2],
+                    -orientations[:, 3], -orientations[:, 0], positions))
+            anmFile.write(data + frames.astype('<f4').tobytes())
 
 
 def importANM(filepath):
@@ -238,9 +256,8 @@ def importANM(filepath):
             boneList.append(anmBone())
             boneList[i].metaDataFromFile(anmFid, header.version)
             # print("bone %s: %s" % (i, boneList[i].name))
-            for j in range(header.numFrames):
-                # print(j)
-                boneList[i].frameDataFromFile(anmFid, header.version)
+            boneList[i].frameDataFromFile(anmFid, header.version,
+                    header.numFrames)
             # print("p:%s\no:%s" % (boneList[i].positions[0],
             #             boneList[i].orientations[0]))
 
@@ -254,8 +271,51 @@ def importANM(filepath):
     return header, boneList
 
 
+anmProbe = namedtuple(
+    "anmProbe",
+    [
+        "version",
+        "numBones",
+        "numFrames",
+        "playbackFPS",
+        "boneOffset",
+        "boneSize",
+        "positionOffset",
+        "orientationOffset",
+        "indexOffset",
+        "expectedSize",
+        "fileSize",
+    ],
+)
+
+
+def probeANM(filepath):
+    """Reads only the header of an .anm file and returns an anmProbe.
+
+    Versions 0, 2 and 3 store fixed size bone records right after the
+    header, so their size is known from the counts.  Version 4 data is
+    reached through the offsets in the header and its expectedSize is
+    None."""
+    header = anmHeader()
+    with open(filepath, 'rb') as anmFid:
+        fileSize = os.fstat(anmFid.fileno()).st_size
+        header.fromFile(anmFid, verbose=False)
+        boneOffset = anmFid.tell()
+
+    if header.version in [0, 2, 3]:
+        boneSize = struct.calcsize('<32si') + header.numFrames * struct.calcsize('<7f')
+        return anmProbe(header.version, header.numBones, header.numFrames,
+                header.playbackFPS, boneOffset, boneSize, None, None, None,
+                boneOffset + header.numBones * boneSize, fileSize)
+    else:  # version 4, the others raise in fromFile
+        return anmProbe(header.version, header.numBones, header.numFrames,
+                header.playbackFPS, None, None, header.positionOffset,
+                header.orientationOffset, header.indexOffset, None, fileSize)
+
+
 def applyANM(header, boneList):
     import bpy
+    import mathutils
     
     # http://blender.stackexchange.com/a/8392
     # http://blender.stackexchange.com/a/31709
@@ -271,18 +331,19 @@ def applyANM(header, boneList):
     editBones = ob.data.edit_bones
     poseBones = ob.pose.bones
 
+    # offset from the parent bone in the bone's object space and rotation
+    # relative to the parent bone, for all bones at once
+    boneIndex = {editBone.name: i for i, editBone in enumerate(editBones)}
+    parents = [boneIndex[e.parent.name] if e.parent else -1 for e in editBones]
+    matrices = np.array([e.matrix for e in editBones], dtype=np.float64).reshape(-1, 4, 4)
+    heads = np.array([e.head for e in editBones], dtype=np.float64).reshape(-1, 3)
+    (offsets, offRots) = lolSkeleton.sklHierarchy(parents).parentOffsets(matrices, heads)
+
     parentOffset = {}
     parentOffRot = {}
-    
-    for editBone in editBones:
-        if editBone.parent != None:
-            # get offset from parent bone in bone's object space
-            parentOffset[editBone.name] = mathutils.Vector(editBone.head - editBone.parent.head) @ editBone.matrix
-            # get bone rotation relative to the parent bone
-            parentOffRot[editBone.name] = editBone.parent.matrix.to_quaternion().rotation_difference(editBone.matrix.to_quaternion())
-        else:
-            parentOffset[editBone.name] = mathutils.Vector(editBone.head) @ editBone.matrix
-            parentOffRot[editBone.name] = mathutils.Quaternion([1.0, 0.0, 0.0, 0.0]).rotation_difference(editBone.matrix.to_quaternion())
+    for name, i in boneIndex.items():
+        parentOffset[name] = mathutils.Vector(offsets[i])
+        parentOffRot[name] = mathutils.Quaternion(offRots[i])
 
     if header.version in [1, 3, 4, 5]:
         scene.render.fps = header.playbackFPS
@@ -294,8 +355,8 @@ def applyANM(header, boneList):
             
             for b in boneList:
                 n = b.name
-                boneRotation = b.orientations[f]
-                bonePosition = b.positions[f]
+                boneRotation = mathutils.Quaternion(b.orientations[f])
+                bonePosition = mathutils.Vector(b.positions[f])
 
                 poseBone = poseBones[n]
                 editBone = editBones[n]
@@ -327,8 +388,9 @@ def applyANM(header, boneList):
 
 def exportANM(skelObj, output_filepath, input_filepath, OVERWRITE_FILE_VERSION, VERSION):
     import bpy
+    import mathutils
     
-    (import_header, import_bonelist) = importANM(input_filepath)
+    (import_header, import_bonelist) = lolCache.cachedParse(input_filepath, importANM)
     
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.object.select_all(action='DESELECT')
@@ -340,7 +402,7 @@ def exportANM(skelObj, output_filepath, input_filepath, OVERWRITE_FILE_VERSION,
     pb = skelObj.pose.bones
     numBones = len(objBones)
     
-    header = import_header
+    header = copy.copy(import_header)  # the cached header is shared
     if OVERWRITE_FILE_VERSION:
         header.version = VERSION
         
@@ -351,24 +413,32 @@ def exportANM(skelObj, output_filepath, input_filepath, OVERWRITE_FILE_VERSION,
         header.numFrames = scene.frame_end - scene.frame_start + 1
         
         boneList = []
-        parentOffset = {}
-        parentOffRot = {}
-        
         for i, b in enumerate(objBones):
             boneList.append(anmBone())
             boneList[-1].name = b.name
             
             #most bones have a value of zero / bones without parent have a value of 2 / 
-            if b.parent != None:
-                boneList[-1].unknown = 0
-                
-                parentOffset[b.name] = mathutils.Vector(b.matrix_local.decompose()[0] - b.parent.matrix_local.decompose()[0]) @ b.matrix_local
-                parentOffRot[b.name] = objBones[b.parent.name].matrix_local.to_quaternion().rotation_difference(b.matrix_local.to_quaternion())
+            boneList[-1].unknown = 0 if b.parent != None else 2
+
+        # rest offsets relative to the parent, and the inverted rest
+        # matrices used every frame, computed once for all bones
+        boneIndex = {b.name: i for i, b in enumerate(objBones)}
+        parents = [boneIndex[b.parent.name] if b.parent else -1 for b in objBones]
+        matrices = np.array([b.matrix_local for b in objBones], dtype=np.float64).reshape(-1, 4, 4)
+        heads = np.array([b.head_local for b in objBones], dtype=np.float64).reshape(-1, 3)
+        (offsets, offRots) = lolSkeleton.sklHierarchy(parents).parentOffsets(matrices, heads)
+        inverseMatrices = lolMath.invertAffine(matrices)
+
+        parentOffset = {}
+        parentOffRot = {}
+        inverseLocal = {}
+        for name, i in boneIndex.items():
+            parentOffset[name] = mathutils.Vector(offsets[i])
+            if parents[i] == -1:
+                parentOffRot[name] = mathutils.Quaternion([1.0, 0.0, 0.0, 0.0])
             else:
-                boneList[-1].unknown = 2
-                
-                parentOffset[b.name] = mathutils.Vector(b.head) @ b.matrix_local
-                parentOffRot[b.name] = mathutils.Quaternion([1.0, 0.0, 0.0, 0.0])
+                parentOffRot[name] = mathutils.Quaternion(offRots[i])
+            inverseLocal[name] = mathutils.Matrix(inverseMatrices[i].tolist())
         
         for f in range(scene.frame_start, scene.frame_end + 1):
             bpy.context.scene.frame_set(f)
@@ -383,7 +453,7 @@ def exportANM(skelObj, output_filepath, input_filepath, OVERWRITE_FILE_VERSION,
                 boneOrient = parentOffRot[n] @ poseBone.rotation_quaternion
                 
                 if objBone.parent != None:
-                    bonePos = bonePos @ objBone.matrix_local.inverted()
+                    bonePos = bonePos @ inverseLocal[n]
                     bonePos = bonePos @ poseBone.parent.matrix
                 
                 bonePos[2] = -bonePos[2]
@@ -395,7 +465,7 @@ def exportANM(skelObj, output_filepath, input_filepath, OVERWRITE_FILE_VERSION,
         header.toFile(anmFid)
         
         for b in boneList:
-            b.toFile(anmFid, import_header.version)
+            b.toFile(anmFid, header.version)
         
         anmFid.close()
         
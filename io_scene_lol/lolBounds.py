@@ -0,0 +1,96 @@
+# ##### BEGIN GPL LICENSE BLOCK ##### #
+# lolblender - Python addon to use League of Legends files into blender
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Bounding volumes for exported meshes, computed from vertex positions.
+# The sphere starts from Ritter's extreme-point guess and is then tightened
+# by repeatedly shrinking it and growing it back over the farthest points.
+
+# <pep8 compliant>
+from collections import namedtuple
+
+import numpy as np
+
+meshBounds = namedtuple("meshBounds", ["boxMin", "boxMax", "sphereCenter", "sphereRadius"])
+
+
+def boundingBox(positions):
+    """Returns the axis aligned (min, max) corners of an (N, 3) array"""
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    if len(positions) == 0:
+        return np.zeros(3), np.zeros(3)
+    return positions.min(axis=0), positions.max(axis=0)
+
+
+def growSphere(positions, center, radius):
+    """Grows a sphere until it contains every point, moving it towards the
+    farthest outside point each step as in Ritter's algorithm.  The
+    returned radius is the distance to the farthest point."""
+    center = np.array(center, dtype=np.float64)
+    while True:
+        distSq = ((positions - center) ** 2).sum(axis=1)
+        far = int(distSq.argmax())
+        dist = np.sqrt(distSq[far])
+        if dist <= radius * (1.0 + 1e-7):
+            # the tolerance may leave points just outside
+            return center, dist
+        newRadius = (radius + dist) * 0.5
+        center += (positions[far] - center) * ((newRadius - radius) / dist)
+        radius = newRadius
+
+
+def boundingSphere(positions, iterations=8, shrink=0.95):
+    """Returns a tight (center, radius) bounding sphere of an (N, 3) array.
+
+    Ritter's guess uses the most distant pair among the per-axis extreme
+    points.  Each refinement iteration shrinks the best sphere so far and
+    regrows it, keeping the result if it got smaller."""
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    if len(positions) == 0:
+        return np.zeros(3), 0.0
+
+    extremes = positions[np.concatenate((positions.argmin(axis=0), positions.argmax(axis=0)))]
+    spans = ((extremes[:3] - extremes[3:]) ** 2).sum(axis=1)
+    axis = int(spans.argmax())
+    center = (extremes[axis] + extremes[axis + 3]) * 0.5
+    radius = np.sqrt(spans[axis]) * 0.5
+
+    (bestCenter, bestRadius) = growSphere(positions, center, radius)
+    for k in range(iterations):
+        (center, radius) = growSphere(positions, bestCenter, bestRadius * shrink)
+        if radius < bestRadius:
+            (bestCenter, bestRadius) = (center, radius)
+
+    return bestCenter, float(bestRadius)
+
+
+def computeBounds(positions):
+    """Returns the meshBounds of an (N, 3) position array"""
+    (boxMin, boxMax) = boundingBox(positions)
+    (sphereCenter, sphereRadius) = boundingSphere(positions)
+    return meshBounds(boxMin, boxMax, sphereCenter, sphereRadius)
+
+
+def materialBounds(positions, indices, materials):
+    """Returns the meshBounds of the vertices referenced by each
+    material's index range (startIndex, numIndices)"""
+    positions = np.asarray(positions).reshape(-1, 3)
+    indices = np.asarray(indices)
+    bounds = []
+    for material in materials:
+        used = np.unique(indices[material.startIndex : material.startIndex + material.numIndices])
+        bounds.append(computeBounds(positions[used]))
+    return bounds
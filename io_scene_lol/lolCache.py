@@ -0,0 +1,97 @@
+# ##### BEGIN GPL LICENSE BLOCK ##### #
+# lolblender - Python addon to use League of Legends files into blender
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+# Parsed file cache shared by the import and export entry points, so a file
+# that is read more than once per session (import_char, BASE_ON_IMPORT
+# exports) is only parsed once.  Entries are keyed by path, size and
+# modification time, so a file changed on disk is parsed again.  Textures
+# get an index of their own that maps each path to one image datablock.
+
+# <pep8 compliant>
+import os
+from collections import OrderedDict
+
+
+class parseCache:
+    """LRU cache of parsed files, bounded by the total size of the files.
+
+    value = cache.get(filepath, loader) returns loader(filepath), parsed at
+    most once while the file is unchanged.  Values are shared between
+    callers and must be treated as read-only; copy anything (e.g. a header)
+    before changing it.
+    """
+
+    def __init__(self, maxBytes=256 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.numBytes = 0
+        self.entries = OrderedDict()
+
+    def get(self, filepath, loader):
+        stat = os.stat(filepath)
+        key = (loader.__module__, loader.__qualname__, os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        # an older version of the same file will never be hit again
+        for oldKey in [k for k in self.entries if k[:3] == key[:3]]:
+            del self.entries[oldKey]
+            self.numBytes -= oldKey[-2]
+
+        value = loader(filepath)
+        if stat.st_size <= self.maxBytes:
+            self.entries[key] = value
+            self.numBytes += stat.st_size
+            while self.numBytes > self.maxBytes:
+                oldKey = self.entries.popitem(last=False)[0]
+                self.numBytes -= oldKey[-2]
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.numBytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+sessionCache = parseCache()
+
+
+def cachedParse(filepath, loader):
+    """Returns loader(filepath) through the session cache"""
+    return sessionCache.get(filepath, loader)
+
+
+# absolute path -> name of the image datablock loaded from it
+imageIndex = {}
+
+
+def loadImage(filepath):
+    """Returns the one image datablock for filepath, loading it on first
+    use.  Images already in the blend file are reused by path, and the
+    index is checked against bpy.data so deleted images are reloaded."""
+    import bpy
+
+    filepath = os.path.abspath(filepath)
+    image = bpy.data.images.get(imageIndex.get(filepath, ""))
+    if image is None or os.path.abspath(bpy.path.abspath(image.filepath)) != filepath:
+        image = bpy.data.images.load(filepath, check_existing=True)
+        imageIndex[filepath] = image.name
+    return image
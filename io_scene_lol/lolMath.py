@@ -0,0 +1,180 @@
+# ##### BEGIN GPL LICENSE BLOCK ##### #
+# lolblender - Python addon to use League of Legends files into blender
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+# Vectorized rotation and transform math on numpy arrays, so the file
+# parsers work without Blender's mathutils.  Quaternions are (..., 4) arrays
+# in Blender's (w, x, y, z) order, matrices are (..., 3, 3) rotations or
+# (..., 4, 4) affine transforms acting on column vectors.  Every function
+# broadcasts over leading dimensions.
+
+# <pep8 compliant>
+import numpy as np
+
+
+def quatMultiply(a, b):
+    """Hamilton product a * b, i.e. the rotation b followed by a"""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    (aw, ax, ay, az) = np.moveaxis(a, -1, 0)
+    (bw, bx, by, bz) = np.moveaxis(b, -1, 0)
+    return np.stack(
+        (
+            aw * bw - ax * bx - ay * by - az * bz,
+            aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+        ),
+        axis=-1,
+    )
+
+
+def quatConjugate(q):
+    return np.asarray(q, dtype=np.float64) * np.array([1.0, -1.0, -1.0, -1.0])
+
+
+def quatInverse(q):
+    q = np.asarray(q, dtype=np.float64)
+    return quatConjugate(q) / (q * q).sum(axis=-1, keepdims=True)
+
+
+def quatNormalize(q):
+    """Unit quaternions; zero quaternions become the identity"""
+    q = np.asarray(q, dtype=np.float64)
+    length = np.sqrt((q * q).sum(axis=-1, keepdims=True))
+    identity = np.broadcast_to(np.array([1.0, 0.0, 0.0, 0.0]), q.shape)
+    return np.where(length > 0.0, q / np.where(length > 0.0, length, 1.0), identity)
+
+
+def quatSlerp(a, b, t):
+    """Spherical interpolation from a (t=0) to b (t=1) along the shorter arc"""
+    a = quatNormalize(a)
+    b = quatNormalize(b)
+    t = np.asarray(t, dtype=np.float64)[..., np.newaxis]
+    dot = (a * b).sum(axis=-1, keepdims=True)
+    b = np.where(dot < 0.0, -b, b)
+    dot = np.abs(dot)
+
+    # fall back to a normalized lerp where the arc is too short to divide by
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sinTheta = np.sin(theta)
+    near = sinTheta < 1e-6
+    safeSin = np.where(near, 1.0, sinTheta)
+    wa = np.where(near, 1.0 - t, np.sin((1.0 - t) * theta) / safeSin)
+    wb = np.where(near, t, np.sin(t * theta) / safeSin)
+    return quatNormalize(wa * a + wb * b)
+
+
+def quatRotate(q, v):
+    """Rotates (..., 3) vectors v by the quaternions q"""
+    q = quatNormalize(q)
+    v = np.asarray(v, dtype=np.float64)
+    w = q[..., :1]
+    u = q[..., 1:]
+    t = 2.0 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
+def quatToMatrix(q):
+    """(..., 3, 3) rotation matrices of the quaternions q"""
+    (w, x, y, z) = np.moveaxis(quatNormalize(q), -1, 0)
+    return np.stack(
+        (
+            np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)), axis=-1),
+            np.stack((2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)), axis=-1),
+            np.stack((2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)), axis=-1),
+        ),
+        axis=-2,
+    )
+
+
+def matrixToQuat(m):
+    """Unit quaternions (w >= 0) of (..., 3, 3) rotation matrices.  The
+    upper 3x3 of larger matrices is used, so (..., 4, 4) works too."""
+    m = np.asarray(m, dtype=np.float64)[..., :3, :3]
+    (m00, m11, m22) = (m[..., 0, 0], m[..., 1, 1], m[..., 2, 2])
+
+    # 4 * each squared component, from the diagonal; build from the largest
+    # to avoid dividing by a small number
+    squares = np.stack(
+        (1 + m00 + m11 + m22, 1 + m00 - m11 - m22, 1 - m00 + m11 - m22, 1 - m00 - m11 + m22), axis=-1
+    )
+    largest = squares.argmax(axis=-1)
+    s = np.sqrt(np.maximum(np.take_along_axis(squares, largest[..., np.newaxis], -1)[..., 0], 1e-300)) * 2.0
+
+    (zy, yz) = (m[..., 2, 1], m[..., 1, 2])
+    (xz, zx) = (m[..., 0, 2], m[..., 2, 0])
+    (yx, xy) = (m[..., 1, 0], m[..., 0, 1])
+    candidates = np.stack(
+        (
+            np.stack((s / 4, (zy - yz) / s, (xz - zx) / s, (yx - xy) / s), axis=-1),
+            np.stack(((zy - yz) / s, s / 4, (xy + yx) / s, (xz + zx) / s), axis=-1),
+            np.stack(((xz - zx) / s, (xy + yx) / s, s / 4, (yz + zy) / s), axis=-1),
+            np.stack(((yx - xy) / s, (xz + zx) / s, (yz + zy) / s, s / 4), axis=-1),
+        ),
+        axis=-2,
+    )
+    q = np.take_along_axis(candidates, largest[..., np.newaxis, np.newaxis], -2)[..., 0, :]
+    return quatNormalize(np.where(q[..., :1] < 0.0, -q, q))
+
+
+def composeAffine(rotation=None, translation=None, scale=None):
+    """(..., 4, 4) transforms T * R * S.  rotation is a (..., 3, 3) matrix or
+    a (..., 4) quaternion, scale a scalar or (..., 3); any part may be None."""
+    shapes = []
+    if rotation is not None:
+        rotation = np.asarray(rotation, dtype=np.float64)
+        if rotation.shape[-1] == 4:
+            rotation = quatToMatrix(rotation)
+        shapes.append(rotation.shape[:-2])
+    if translation is not None:
+        translation = np.asarray(translation, dtype=np.float64)
+        shapes.append(translation.shape[:-1])
+    if scale is not None:
+        scale = np.asarray(scale, dtype=np.float64)
+        if scale.ndim == 0 or scale.shape[-1] != 3:
+            scale = scale[..., np.newaxis] * np.ones(3)
+        shapes.append(scale.shape[:-1])
+    shape = np.broadcast_shapes(*shapes) if shapes else ()
+
+    m = np.zeros(shape + (4, 4))
+    m[..., :3, :3] = rotation if rotation is not None else np.eye(3)
+    if scale is not None:
+        m[..., :3, :3] *= scale[..., np.newaxis, :]
+    if translation is not None:
+        m[..., :3, 3] = translation
+    m[..., 3, 3] = 1.0
+    return m
+
+
+def invertAffine(m):
+    """Inverses of (..., 4, 4) affine transforms.  The linear part is
+    inverted in general, so scaled and sheared transforms work too."""
+    m = np.asarray(m, dtype=np.float64)
+    linear = np.linalg.inv(m[..., :3, :3])
+    inverse = np.zeros(m.shape)
+    inverse[..., :3, :3] = linear
+    inverse[..., :3, 3] = -(linear @ m[..., :3, 3, np.newaxis])[..., 0]
+    inverse[..., 3, 3] = 1.0
+    return inverse
+
+
+def transformPoints(m, points):
+    """Applies (..., 4, 4) transforms to (..., 3) points"""
+    m = np.asarray(m, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+    return (m[..., :3, :3] @ points[..., np.newaxis])[..., 0] + m[..., :3, 3]
@@ -17,8 +17,17 @@
 
 # <pep8 compliant>
 # from collections import UserDict
+import copy
+import io
+import mmap
+import os
 import struct
-from collections import OrderedDict
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+from . import lolBounds, lolCache, lolVertexCache
 
 testFile = "/var/tmp/downloads/lol/Wolfman/Wolfman.skn"
 
@@ -34,7 +43,7 @@ class sknHeader:
         self.numMaterials = 0
         self.endTab = [0, 0, 0]
 
-    def fromFile(self, sknFid):
+    def fromFile(self, sknFid, verbose=True):
         buf = sknFid.read(self.__size__)
         (self.magic, self.version, self.numObjects) = struct.unpack(self.__format__, buf)
 
@@ -46,16 +55,19 @@ class sknHeader:
         else:
             raise ValueError("Unknown version: ", self.version)
 
-        print("SKN version: %s" % self.version)
-        print("numObjects: %s" % self.numObjects)
-        print("numMaterials: %s" % self.numMaterials)
+        if verbose:
+            print("SKN version: %s" % self.version)
+            print("numObjects: %s" % self.numObjects)
+            print("numMaterials: %s" % self.numMaterials)
 
     def toFile(self, sknFid):
         buf = struct.pack(self.__format__, self.magic, self.version, self.numObjects)
 
         sknFid.write(buf)
 
-        sknFid.write(struct.pack("<i", self.numMaterials))
+        # version 0 has exactly one material and no count
+        if self.version != 0:
+            sknFid.write(struct.pack("<i", self.numMaterials))
 
     def __str__(self):
         return "{'__format__': %s, '__size__': %d, 'magic': %d, 'version': %d, 'numObjects':%d}" % (
@@ -99,7 +111,11 @@ class sknMaterial:
             self.numIndices = fields[0]
             self.numVertices = fields[1]
 
-    def toFile(self, sknFid):
+    def toFile(self, sknFid, version=4):
+        if version == 0:
+            sknFid.write(struct.pack(self.__format__v0, self.numIndices, self.numVertices))
+            return
+
         buf = struct.pack(
             self.__format__v124,
             self.name.encode(),
@@ -137,6 +153,7 @@ class sknMetaData:
         boundingBoxMax=None,
         boundingSpherePos=None,
         boundingSphereRadius=None,
+        indexSize=2,
     ):
         # # UserDict.__init__(self)
         self.__format__v12 = "<2i"
@@ -153,6 +170,8 @@ class sknMetaData:
         self.boundingBoxMax = boundingBoxMax
         self.boundingSpherePos = boundingSpherePos
         self.boundingSphereRadius = boundingSphereRadius
+        # not stored in the file; 2 (uint16) unless a v4 file uses 32 bit indices
+        self.indexSize = indexSize
 
     def fromFile(self, sknFid, version):
         if version in [1, 2]:
@@ -199,6 +218,8 @@ class sknMetaData:
                 self.boundingSphereRadius,
             )
             sknFid.write(buf)
+        elif version in [0]:
+            pass
         else:
             raise ValueError("Version %s not supported" % version)
 
@@ -291,24 +312,142 @@ class sknVertex:
             sknFid.write(buf)
 
 
-class scoObject:
-    def __init__(self):
-        self.name = None
-        self.centralpoint = None
-        self.pivotpoint = None
-        self.vtxList = []
-        self.faceList = []
-        self.uvDict = {}
-        self.materialDict = {}
+# Packed vertex records by (vertexBlockSize, containsVertexColor).  Every
+# layout starts with the 52 byte base record.
+#
+# position    float[3]    12
+# boneIndex   uchar[4]    4       indices into the (reordered) bone list
+# weights     float[4]    16
+# normal      float[3]    12
+# texcoords   float[2]    8
+# vertexColor uchar[4]    4       containsVertexColor 1 and 2
+# tangent     float[4]    16      containsVertexColor 2, xyz and handedness
+sknBaseVertexFields = [
+    ("position", "<f4", (3,)),
+    ("boneIndex", "u1", (4,)),
+    ("weights", "<f4", (4,)),
+    ("normal", "<f4", (3,)),
+    ("texcoords", "<f4", (2,)),
+]
+sknVertexLayouts = {
+    (52, 0): sknBaseVertexFields,
+    (56, 1): sknBaseVertexFields + [("vertexColor", "u1", (4,))],
+    (72, 2): sknBaseVertexFields + [("vertexColor", "u1", (4,)), ("tangent", "<f4", (4,))],
+}
+
+
+def sknVertexDtype(vertexBlockSize=52, containsVertexColor=0):
+    """Returns the numpy structured dtype of one packed SKN vertex record.
+
+    Known layouts come from sknVertexLayouts.  Any other block size is
+    decoded as the base record (plus color if flagged) followed by an
+    opaque "extra" field holding the remaining bytes, so they survive a
+    round trip untouched."""
+    fields = sknVertexLayouts.get((vertexBlockSize, containsVertexColor))
+    if fields is None:
+        fields = list(sknBaseVertexFields)
+        if containsVertexColor:
+            fields.append(("vertexColor", "u1", (4,)))
+        extraSize = vertexBlockSize - np.dtype(fields).itemsize
+        if extraSize < 0:
+            raise ValueError(
+                "Vertex block size %d is too small for the %d byte layout (containsVertexColor=%d)"
+                % (vertexBlockSize, np.dtype(fields).itemsize, containsVertexColor)
+            )
+        if extraSize > 0:
+            fields.append(("extra", "V%d" % extraSize))
+    return np.dtype(fields)
+
+
+def sknIndexDtype(indexSize=2):
+    """Returns the numpy dtype of one index.
+
+    Indices are unsigned 16 bit, so a mesh can address 65536 vertices.
+    32 bit indices are an opt-in extension that is only allowed in
+    version 4 files."""
+    if indexSize == 2:
+        return np.dtype("<u2")
+    elif indexSize == 4:
+        return np.dtype("<u4")
+    raise ValueError("Index size must be 2 or 4 bytes, not %s" % indexSize)
+
+
+def checkIndexSize(indexSize, version, numVertices):
+    """Raises a ValueError if indexSize cannot be used for this file"""
+    dtype = sknIndexDtype(indexSize)
+    if indexSize == 4 and version != 4:
+        raise ValueError("32 bit indices are only supported in SKN version 4, not %s" % version)
+    if numVertices > np.iinfo(dtype).max + 1:
+        raise ValueError(
+            "%d vertices can not be addressed with %d bit indices%s"
+            % (numVertices, 8 * indexSize, ", use 32 bit indices" if indexSize == 2 else "")
+        )
 
 
-def importSKN(filepath):
-    sknFid = open(filepath, "rb")
-    print("Reading SKN: %s" % filepath)
-    # filepath = path.split(file)[-1]
-    # print(filepath)
+def detectIndexSize(metaData, version, remainingBytes):
+    """Guesses the index size of a file from the number of bytes that
+    follow the metadata block. 16 bit indices are assumed unless the file
+    is version 4 and only the 32 bit layout matches its size."""
+    if version != 4:
+        return 2
+    rest = remainingBytes - metaData.numVertices * metaData.vertexBlockSize - 12  # endTab
+    if rest != 2 * metaData.numIndices and rest == 4 * metaData.numIndices:
+        return 4
+    return 2
+
+
+def readIndices(sknFid, numIndices, numVertices, indexSize=2):
+    """Reads the whole index buffer with a single read.
+
+    Returns a flat numpy uint16 (or uint32) array; indices.reshape(-1, 3)
+    is a zero-copy (numTriangles, 3) view of the same buffer."""
+    dtype = sknIndexDtype(indexSize)
+
+    buf = bytearray(numIndices * dtype.itemsize)
+    if sknFid.readinto(buf) != len(buf):
+        raise ValueError("Unexpected end of file while reading %d indices" % numIndices)
+
+    indices = np.frombuffer(buf, dtype=dtype)
+    if numIndices > 0 and indices.max() >= numVertices:
+        raise ValueError("Index %d out of range for %d vertices" % (indices.max(), numVertices))
+    return indices
+
+
+def checkIndices(indices, indexSize=2):
+    """Raises a ValueError if indices do not fit into indexSize bytes"""
+    dtype = sknIndexDtype(indexSize)
+    indices = np.asarray(indices)
+    if indices.size > 0 and (indices.min() < 0 or indices.max() > np.iinfo(dtype).max):
+        raise ValueError("Indices do not fit into %d bits" % (8 * indexSize))
+
+
+def writeIndices(sknFid, indices, indexSize=2):
+    """Writes the whole index buffer with a single write"""
+    checkIndices(indices, indexSize)
+    sknFid.write(np.ascontiguousarray(indices, dtype=sknIndexDtype(indexSize)).tobytes())
+
+
+def readVertices(sknFid, metaData):
+    """Reads the whole vertex block with a single read.
+
+    Returns a numpy record array, so each attribute (e.g. vertices.position)
+    is a zero-copy column view of the block and single vertices still
+    behave like sknVertex (vertices[k].position)."""
+    dtype = sknVertexDtype(metaData.vertexBlockSize, metaData.containsVertexColor)
+
+    buf = bytearray(metaData.numVertices * dtype.itemsize)
+    if sknFid.readinto(buf) != len(buf):
+        raise ValueError("Unexpected end of file while reading %d vertices" % metaData.numVertices)
+
+    return np.frombuffer(buf, dtype=dtype).view(np.recarray)
+
+
+def readHeaders(sknFid, fileSize, indexSize=None, verbose=True):
+    """Reads the fixed-size part of a .skn file (header, materials and
+    metadata) and leaves sknFid at the start of the index buffer.
+    verbose=False skips the header printout, for probing many files."""
     header = sknHeader()
-    header.fromFile(sknFid)
+    header.fromFile(sknFid, verbose)
 
     materials = []
 
@@ -322,23 +461,440 @@ def importSKN(filepath):
         metaData.numIndices = materials[0].numIndices
         metaData.numVertices = materials[0].numVertices
 
-    indices = []
-    vertices = []
-    for k in range(metaData.numIndices):
-        buf = sknFid.read(struct.calcsize("<h"))
-        indices.append(struct.unpack("<h", buf)[0])
+    if indexSize is None:
+        indexSize = detectIndexSize(metaData, header.version, fileSize - sknFid.tell())
+    checkIndexSize(indexSize, header.version, metaData.numVertices)
+    metaData.indexSize = indexSize
+
+    return header, materials, metaData
+
+
+class sknMappedFile:
+    """Memory mapped, lazily decoded .skn file.
+
+    Only the header, materials and metadata are parsed when the file is
+    opened.  indices and vertices are zero-copy read-only views into the
+    mapping that are created on first access, so nothing but the touched
+    pages is ever read from disk.
+
+    with sknMappedFile(path) as skn:
+        print(skn.metaData.boundingBoxMin)
+        triangles = skn.indices.reshape(-1, 3)
+
+    Views taken from the file keep the mapping alive after close().
+    """
+
+    def __init__(self, filepath, indexSize=None):
+        self.filepath = filepath
+        self._indices = None
+        self._vertices = None
+        self.sknMap = None
+        self.sknFid = open(filepath, "rb")
+        try:
+            self.sknMap = mmap.mmap(self.sknFid.fileno(), 0, access=mmap.ACCESS_READ)
+            (self.header, self.materials, self.metaData) = readHeaders(self.sknFid, len(self.sknMap), indexSize)
+        except Exception:
+            self.close()
+            raise
+
+        self.indexOffset = self.sknFid.tell()
+        self.vertexOffset = self.indexOffset + self.metaData.numIndices * self.metaData.indexSize
+        self.endTabOffset = self.vertexOffset + self.metaData.numVertices * self.metaData.vertexBlockSize
+        if self.endTabOffset > len(self.sknMap):
+            self.close()
+            raise ValueError("%s is truncated: expected at least %d bytes" % (filepath, self.endTabOffset))
+
+        if self.header.version >= 2:
+            self.header.endTab = list(struct.unpack_from("<3i", self.sknMap, self.endTabOffset))
+
+    @property
+    def indices(self):
+        if self._indices is None:
+            dtype = sknIndexDtype(self.metaData.indexSize)
+            indices = np.frombuffer(self.sknMap, dtype, self.metaData.numIndices, self.indexOffset)
+            if indices.size > 0 and indices.max() >= self.metaData.numVertices:
+                raise ValueError("Index %d out of range for %d vertices" % (indices.max(), self.metaData.numVertices))
+            self._indices = indices
+        return self._indices
+
+    @property
+    def vertices(self):
+        if self._vertices is None:
+            dtype = sknVertexDtype(self.metaData.vertexBlockSize, self.metaData.containsVertexColor)
+            self._vertices = np.frombuffer(self.sknMap, dtype, self.metaData.numVertices, self.vertexOffset).view(
+                np.recarray
+            )
+        return self._vertices
+
+    def close(self):
+        self._indices = None
+        self._vertices = None
+        try:
+            if self.sknMap is not None:
+                self.sknMap.close()
+        except BufferError:
+            pass  # a caller still holds a view, the mapping goes away with it
+        self.sknFid.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class sknVertexView:
+    """Vertex-like view of one row of a sknMesh, for code written against
+    lists of sknVertex.  Attributes are views into the mesh columns."""
+
+    __slots__ = ("mesh", "index")
+
+    def __init__(self, mesh, index):
+        self.mesh = mesh
+        self.index = index
+
+    @property
+    def position(self):
+        return self.mesh.position[self.index]
+
+    @property
+    def boneIndex(self):
+        return self.mesh.boneIndex[self.index]
+
+    @property
+    def weights(self):
+        return self.mesh.weights[self.index]
+
+    @property
+    def normal(self):
+        return self.mesh.normal[self.index]
+
+    @property
+    def texcoords(self):
+        return self.mesh.texcoords[self.index]
+
+    @property
+    def vertexColor(self):
+        return self.mesh.vertexColor[self.index]
+
+    @property
+    def tangent(self):
+        return self.mesh.tangent[self.index]
+
+
+class sknMesh:
+    """Columnar SKN mesh.
+
+    Every vertex attribute is one contiguous numpy array:
+    position    float32 (N, 3)
+    boneIndex   uint8   (N, 4)
+    weights     float32 (N, 4)
+    normal      float32 (N, 3)
+    texcoords   float32 (N, 2)
+    vertexColor uint8   (N, 4), or None
+    tangent     float32 (N, 4), or None
+    extra       void    (N,), unknown trailing vertex bytes, or None
+
+    indices is a flat uint16 (or uint32) array.  Material ranges live in
+    materials (see also materialRanges), the rest in header and metaData.
+
+    The mesh is also a sequence of sknVertexView, so code that iterates
+    over the vertices returned by importSKN keeps working.
+    """
+
+    __slots__ = (
+        "header",
+        "materials",
+        "metaData",
+        "indices",
+        "position",
+        "boneIndex",
+        "weights",
+        "normal",
+        "texcoords",
+        "vertexColor",
+        "tangent",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        header=None,
+        materials=None,
+        metaData=None,
+        indices=None,
+        position=None,
+        boneIndex=None,
+        weights=None,
+        normal=None,
+        texcoords=None,
+        vertexColor=None,
+        tangent=None,
+        extra=None,
+    ):
+        self.header = header
+        self.materials = materials if materials is not None else []
+        self.metaData = metaData
+        self.indices = indices
+        self.position = position
+        self.boneIndex = boneIndex
+        self.weights = weights
+        self.normal = normal
+        self.texcoords = texcoords
+        self.vertexColor = vertexColor
+        self.tangent = tangent
+        self.extra = extra
+
+    def fromFile(self, sknFid, indexSize=None):
+        start = sknFid.tell()
+        fileSize = sknFid.seek(0, 2)
+        sknFid.seek(start)
+        (self.header, self.materials, self.metaData) = readHeaders(sknFid, fileSize, indexSize)
+
+        self.indices = readIndices(sknFid, self.metaData.numIndices, self.metaData.numVertices, self.metaData.indexSize)
+
+        vertices = readVertices(sknFid, self.metaData)
+        self.position = np.ascontiguousarray(vertices.position)
+        self.boneIndex = np.ascontiguousarray(vertices.boneIndex)
+        self.weights = np.ascontiguousarray(vertices.weights)
+        self.normal = np.ascontiguousarray(vertices.normal)
+        self.texcoords = np.ascontiguousarray(vertices.texcoords)
+        for name in ("vertexColor", "tangent", "extra"):
+            if name in vertices.dtype.names:
+                setattr(self, name, np.ascontiguousarray(vertices[name]))
+            else:
+                setattr(self, name, None)
+
+        # exclusive to version two+.
+        if self.header.version >= 2:  # stuck in header b/c nowhere else for it
+            self.header.endTab = list(struct.unpack("<3i", sknFid.read(struct.calcsize("<3i"))))
+
+    def toFile(self, sknFid):
+        sknFid.write(self.toBytes())
+
+    def fromBytes(self, data, indexSize=None):
+        self.fromFile(io.BytesIO(data), indexSize)
+
+    def toBytes(self):
+        """Assembles the whole .skn file in one preallocated buffer.  The
+        counts in header and metaData are updated from the arrays first.
+        Version 0 files hold a single material spanning the whole mesh,
+        whose counts are updated too."""
+        version = self.header.version
+        numIndices = len(self.indices)
+        numVertices = len(self.position)
+        self.header.numMaterials = len(self.materials)
+        self.metaData.numIndices = numIndices
+        self.metaData.numVertices = numVertices
+        checkIndexSize(self.metaData.indexSize, version, numVertices)
+        checkIndices(self.indices, self.metaData.indexSize)
+        if numVertices > 0 and np.max(self.boneIndex) > 255:
+            raise ValueError("Bone index %d does not fit into a byte" % np.max(self.boneIndex))
+        if version == 0:
+            if len(self.materials) != 1:
+                raise ValueError("Version 0 files have exactly one material, not %d" % len(self.materials))
+            self.materials[0].numIndices = numIndices
+            self.materials[0].numVertices = numVertices
+
+        # header, materials and metadata are a few hundred bytes at most
+        headFid = io.BytesIO()
+        self.header.toFile(headFid)
+        for material in self.materials:
+            material.toFile(headFid, version)
+        self.metaData.toFile(headFid, version)
+        head = headFid.getvalue()
+
+        indexDtype = sknIndexDtype(self.metaData.indexSize)
+        vertexDtype = sknVertexDtype(self.metaData.vertexBlockSize, self.metaData.containsVertexColor)
+        indexOffset = len(head)
+        vertexOffset = indexOffset + numIndices * indexDtype.itemsize
+        endTabOffset = vertexOffset + numVertices * vertexDtype.itemsize
+
+        buf = bytearray(endTabOffset + (12 if version >= 2 else 0))
+        buf[:indexOffset] = head
+
+        if numIndices > 0:
+            np.frombuffer(buf, indexDtype, numIndices, indexOffset)[:] = self.indices
+
+        if numVertices > 0:
+            vertices = np.frombuffer(buf, vertexDtype, numVertices, vertexOffset)
+            vertices["position"] = self.position
+            vertices["boneIndex"] = self.boneIndex
+            vertices["weights"] = self.weights
+            vertices["normal"] = self.normal
+            vertices["texcoords"] = self.texcoords
+            for name in ("vertexColor", "tangent", "extra"):
+                if name in vertexDtype.names:
+                    if getattr(self, name) is None:
+                        raise ValueError("Vertex layout needs %s but the mesh has none" % name)
+                    vertices[name] = getattr(self, name)
+            del vertices
+
+        # exclusive to version two+.
+        if version >= 2:
+            endTab = self.header.endTab if len(self.header.endTab) == 3 else [0, 0, 0]
+            struct.pack_into("<3i", buf, endTabOffset, *endTab)
+
+        return buf
+
+    @property
+    def materialRanges(self):
+        """(numMaterials, 4) array of startVertex, numVertices, startIndex, numIndices"""
+        return np.array(
+            [(m.startVertex, m.numVertices, m.startIndex, m.numIndices) for m in self.materials], dtype=np.int64
+        ).reshape(-1, 4)
+
+    @property
+    def triangles(self):
+        """(numTriangles, 3) view of indices"""
+        return self.indices.reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.position)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [sknVertexView(self, k) for k in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("vertex index out of range")
+        return sknVertexView(self, index)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield sknVertexView(self, k)
+
+
+class scoObject:
+    def __init__(self):
+        self.name = None
+        self.centralpoint = None
+        self.pivotpoint = None
+        self.vtxList = []
+        self.faceList = []
+        self.uvDict = {}
+        self.materialDict = {}
+
 
-    for k in range(metaData.numVertices):
-        vertices.append(sknVertex())
-        vertices[-1].fromFile(sknFid, metaData.containsVertexColor)
+def readSKN(filepath, indexSize=None):
+    """Reads a .skn file into a sknMesh.
 
-    # exclusive to version two+.
-    if header.version >= 2:  # stuck in header b/c nowhere else for it
-        header.endTab = [struct.unpack("<3i", sknFid.read(struct.calcsize("<3i")))]
+    indexSize:  2 or 4 bytes per index. None detects it from the file size,
+                which only finds 32 bit indices in version 4 files.
+    """
+    sknFid = open(filepath, "rb")
+    print("Reading SKN: %s" % filepath)
+    mesh = sknMesh()
+    try:
+        mesh.fromFile(sknFid, indexSize)
+    finally:
+        sknFid.close()
+
+    return mesh
+
+
+sknProbe = namedtuple(
+    "sknProbe",
+    [
+        "version",
+        "numObjects",
+        "numMaterials",
+        "materialNames",
+        "numIndices",
+        "numVertices",
+        "indexSize",
+        "vertexBlockSize",
+        "containsVertexColor",
+        "indexOffset",
+        "vertexOffset",
+        "endTabOffset",
+        "expectedSize",
+        "fileSize",
+    ],
+)
+
+
+def probeSKN(filepath, indexSize=None):
+    """Reads only the header, materials and metadata of a .skn file.
+
+    Returns a sknProbe with the counts, the offsets of the index buffer,
+    vertex block and end tab, and the file size those imply.  Nothing past
+    the metadata is read, so this is cheap enough to scan whole dumps."""
+    with open(filepath, "rb") as sknFid:
+        fileSize = os.fstat(sknFid.fileno()).st_size
+        (header, materials, metaData) = readHeaders(sknFid, fileSize, indexSize, verbose=False)
+        indexOffset = sknFid.tell()
+
+    vertexOffset = indexOffset + metaData.numIndices * metaData.indexSize
+    endTabOffset = vertexOffset + metaData.numVertices * metaData.vertexBlockSize
+    return sknProbe(
+        header.version,
+        header.numObjects,
+        header.numMaterials,
+        tuple(material.name for material in materials),
+        metaData.numIndices,
+        metaData.numVertices,
+        metaData.indexSize,
+        metaData.vertexBlockSize,
+        metaData.containsVertexColor,
+        indexOffset,
+        vertexOffset,
+        endTabOffset,
+        endTabOffset + (12 if header.version >= 2 else 0),
+        fileSize,
+    )
 
-    sknFid.close()
 
-    return header, materials, metaData, indices, vertices
+def readSKNHeader(filepath):
+    """Reads only the sknHeader of a .skn file, including the version 2+
+    end tab, without decoding the index or vertex buffers."""
+    with open(filepath, "rb") as sknFid:
+        fileSize = os.fstat(sknFid.fileno()).st_size
+        (header, materials, metaData) = readHeaders(sknFid, fileSize, verbose=False)
+        if header.version >= 2:
+            endTabOffset = sknFid.tell() + metaData.numIndices * metaData.indexSize + metaData.numVertices * metaData.vertexBlockSize
+            sknFid.seek(endTabOffset)
+            header.endTab = list(struct.unpack("<3i", sknFid.read(struct.calcsize("<3i"))))
+    return header
+
+
+def writeSKN(filepath, mesh):
+    """Writes a sknMesh to filepath atomically.
+
+    The file is assembled in memory, written to a temporary file next to
+    filepath and renamed over it, so an interrupted export never leaves a
+    half-written .skn behind.  An overwritten file keeps its permissions,
+    a new one gets the usual 0666 & ~umask."""
+    data = mesh.toBytes()
+
+    directory, filename = os.path.split(os.path.abspath(filepath))
+    try:
+        mode = os.stat(filepath).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    (tmpFd, tmpPath) = tempfile.mkstemp(prefix="." + filename, suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(tmpFd, "wb") as sknFid:
+            sknFid.write(data)
+            sknFid.flush()
+            # mkstemp creates the file owner-only
+            os.chmod(tmpPath, mode)
+            os.fsync(sknFid.fileno())
+        os.replace(tmpPath, filepath)
+    except BaseException:
+        os.remove(tmpPath)
+        raise
+
+
+def importSKN(filepath, indexSize=None):
+    """Reads a .skn file.  The returned vertices are the sknMesh itself,
+    which holds the columns and iterates like a list of vertices."""
+    mesh = readSKN(filepath, indexSize)
+    return mesh.header, mesh.materials, mesh.metaData, mesh.indices, mesh
 
 
 def skn2obj(header, materials, indices, vertices):
@@ -346,15 +902,11 @@ def skn2obj(header, materials, indices, vertices):
     if header.version > 0:
         objStr += "g mat_%s\n" % (materials[0].name)
     for vtx in vertices:
-        objStr += "v %f %f %f\n" % (vtx.position)
-        objStr += "vn %f %f %f\n" % (vtx.normal)
+        objStr += "v %f %f %f\n" % tuple(vtx.position)
+        objStr += "vn %f %f %f\n" % tuple(vtx.normal)
         objStr += "vt %f %f\n" % (vtx.texcoords[0], 1 - vtx.texcoords[1])
 
-    tmp = int(len(indices) / 3)
-    for idx in range(tmp):
-        a = indices[3 * idx][0] + 1
-        b = indices[3 * idx + 1][0] + 1
-        c = indices[3 * idx + 2][0] + 1
+    for a, b, c in (indices.reshape(-1, 3).astype(np.int64) + 1).tolist():
         objStr += "f %d/%d/%d" % (a, a, a)
         objStr += " %d/%d/%d" % (b, b, b)
         objStr += " %d/%d/%d\n" % (c, c, c)
@@ -362,33 +914,24 @@ def skn2obj(header, materials, indices, vertices):
     return objStr
 
 
-def buildMesh(filepath):
+def buildMesh(filepath, mesh=None):
+    """Builds a Blender mesh object from a .skn file.  mesh is the already
+    parsed sknMesh of filepath; if None the file is read through the
+    session parse cache."""
     import bpy
     from os import path
 
-    (header, materials, metaData, indices, vertices) = importSKN(filepath)
-    import bmesh
+    if mesh is None:
+        mesh = lolCache.cachedParse(filepath, readSKN)
+    (materials, metaData, indices, vertices) = (mesh.materials, mesh.metaData, mesh.indices, mesh)
 
     """
     if header.version > 0 and materials[0].numMaterials == 2:
         print('ERROR:  Skins with numMaterials = 2 are currently unreadable.  Exiting')
         return{'CANCELLED'}
     """
-    numIndices = len(indices)
-    numVertices = len(vertices)
-    # Create face groups
-    faceList = []
-    for k in range(0, numIndices, 3):
-        # faceList.append( [indices[k], indices[k+1], indices[k+2]] )
-        faceList.append(indices[k : k + 3])
-
-    vtxList = []
-    normList = []
-    uvList = []
-    for vtx in vertices:
-        vtxList.append(vtx.position[:])
-        normList.extend(vtx.normal[:])
-        uvList.append([vtx.texcoords[0], 1 - vtx.texcoords[1]])
+    numLoops = len(indices)
+    numFaces = numLoops // 3
 
     # Build the mesh
     # Get current scene
@@ -397,49 +940,53 @@ def buildMesh(filepath):
     # Use the filename base as the meshname.  i.e. path/to/Akali.skn -> Akali
     meshName = path.split(filepath)[-1]
     meshName = path.splitext(meshName)[0]
-    mesh = bpy.data.meshes.new(meshName)
-    mesh.from_pydata(vtxList, [], faceList)
-    mesh.update()
+    blMesh = bpy.data.meshes.new(meshName)
+
+    # every triangle owns 3 consecutive loops, in index buffer order
+    blMesh.vertices.add(len(vertices))
+    blMesh.vertices.foreach_set("co", np.ascontiguousarray(vertices.position, dtype=np.float32).ravel())
+    blMesh.loops.add(numLoops)
+    blMesh.loops.foreach_set("vertex_index", indices.astype(np.int32))
+    blMesh.polygons.add(numFaces)
+    blMesh.polygons.foreach_set("loop_start", np.arange(0, numLoops, 3, dtype=np.int32))
+    blMesh.polygons.foreach_set("loop_total", np.full(numFaces, 3, dtype=np.int32))
+    blMesh.update(calc_edges=True)
 
     bpy.ops.object.select_all(action="DESELECT")
 
     # Create object from mesh
-    obj = bpy.data.objects.new("lolMesh", mesh)
+    obj = bpy.data.objects.new("lolMesh", blMesh)
 
     # Link object to the current scene
     scene.objects.link(obj)
 
     if metaData.containsVertexColor:
-        # Create vertex color layer
-        obj.data.vertex_colors.new("lolVertexColor")
-        vertColorLayer = obj.data.vertex_colors[-1]
-        for k, loop in enumerate(obj.data.loops):
-            vertIndex = loop.vertex_index
-            vertColorLayer.data[k].color = vertices[vertIndex].vertexColor[0:3]
-        obj.data.vertex_colors.new("lolVertexColorAlpha")
-        vertColorAlphaLayer = obj.data.vertex_colors[-1]
-        for k, loop in enumerate(obj.data.loops):
-            alphaValue = vertices[loop.vertex_index].vertexColor[3]
-            vertColorAlphaLayer.data[k].color = (alphaValue, 0.0, 0.0)
+        # Create vertex color layers, gathered per loop like the uvs below.
+        # Layers are RGBA: the color goes to lolVertexColor with an opaque
+        # alpha and the alpha goes to the red channel of lolVertexColorAlpha
+        loopColors = vertices.vertexColor[indices].astype(np.float32) / np.float32(255.0)
+        layerColors = np.ones((numLoops, 2, 4), dtype=np.float32)
+        layerColors[:, 0, :3] = loopColors[:, :3]
+        layerColors[:, 1, 0] = loopColors[:, 3]
+        layerColors[:, 1, 1:3] = 0.0
+
+        vertColorLayer = obj.data.vertex_colors.new(name="lolVertexColor")
+        vertColorLayer.data.foreach_set("color", np.ascontiguousarray(layerColors[:, 0]).ravel())
+        vertColorAlphaLayer = obj.data.vertex_colors.new(name="lolVertexColorAlpha")
+        vertColorAlphaLayer.data.foreach_set("color", np.ascontiguousarray(layerColors[:, 1]).ravel())
 
     # Create UV texture coords
-    texList = []
+    # loop k uses vertex indices[k], so the loop uvs are a gather
     uvtexName = "lolUVtex"
     obj.data.uv_layers.new(name=uvtexName)
     uv_layer = obj.data.uv_layers[-1].data  # sets layer to the above texture
-    set = []
-    for k, loop in enumerate(obj.data.loops):
-        # data.loops contains the vertex of tris
-        # k/3 = triangle #
-        # k%3 = vertex number in that triangle
-        v = loop.vertex_index  # "index" number
-        set.append(uvList[v][0])  # u
-        set.append(uvList[v][1])  # v
-    uv_layer.foreach_set("uv", set)
+    loopUvs = vertices.texcoords[indices].astype(np.float32)
+    loopUvs[:, 1] = 1.0 - loopUvs[:, 1]
+    uv_layer.foreach_set("uv", loopUvs.ravel())
 
     # Set normals
     # Needs to be done after the UV unwrapping
-    obj.data.vertices.foreach_set("normal", normList)
+    obj.data.vertices.foreach_set("normal", np.ascontiguousarray(vertices.normal, dtype=np.float32).ravel())
 
     for m in materials:
         tex = bpy.data.textures.new(m.name + "_texImage", type="IMAGE")
@@ -460,37 +1007,60 @@ def buildMesh(filepath):
 
         obj.data.materials.append(mat)
 
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.mode_set(mode="EDIT")
-
-    bm = bmesh.from_edit_mesh(obj.data)
-    bm.verts.ensure_lookup_table()
-
+    # Assign material slots.  Polygon k is triangle k of the index buffer,
+    # so each material's index range is a slice of the polygons
+    faceMaterials = np.zeros(numFaces, dtype=np.int32)
     for m, material in enumerate(materials):
-        bpy.ops.mesh.select_all(action="DESELECT")
-        bpy.context.active_object.active_material_index = m
+        startFace = material.startIndex // 3
+        faceMaterials[startFace : startFace + material.numIndices // 3] = m
+    blMesh.polygons.foreach_set("material_index", faceMaterials)
 
-        for i in range(material.startIndex, material.startIndex + material.numIndices, 3):
-            f = bm.faces.get([bm.verts[indices[i]], bm.verts[indices[i + 1]], bm.verts[indices[i + 2]]])
-            f.select = True
-
-        bpy.ops.object.material_slot_assign()
-
-    bm.free()
-    bpy.ops.mesh.select_all(action="DESELECT")
-    bpy.ops.object.mode_set(mode="OBJECT")
+    bpy.context.view_layer.objects.active = obj
 
     # Create material
     # materialName = 'lolMaterial'
     # material = bpy.data.materials.ne(materialName)
-    mesh.update()
+    blMesh.update()
     # set active
     obj.select_set(True)
 
     return {"FINISHED"}
 
 
-def addDefaultWeights(boneList, sknVertices, armatureObj, meshObj):
+def vertexGroupWeights(boneIndex, weights):
+    """Flattens (N, 4) bone index and weight columns into (vertex, bone,
+    weight) arrays for vertex groups.
+
+    Zero weights are dropped and repeated bones of one vertex are summed,
+    as adding them one by one in "ADD" mode would.  The result is sorted
+    by bone and then weight, so equal (bone, weight) pairs are runs."""
+    boneIndex = np.asarray(boneIndex, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float32)
+    numSlots = boneIndex.shape[1]
+    vertex = np.repeat(np.arange(len(boneIndex), dtype=np.int64), numSlots)
+    bone = boneIndex.ravel()
+    weight = weights.ravel()
+
+    # sum repeated (vertex, bone) pairs, in float32 like Blender stores them
+    pairs = np.column_stack((vertex, bone))
+    (pairs, inverse) = np.unique(pairs, axis=0, return_inverse=True)
+    summed = np.zeros(len(pairs), dtype=np.float32)
+    np.add.at(summed, inverse.reshape(-1), weight)
+
+    keep = summed != 0.0
+    (vertex, bone, weight) = (pairs[keep, 0], pairs[keep, 1], summed[keep])
+    order = np.lexsort((vertex, weight, bone))
+    return vertex[order], bone[order], weight[order]
+
+
+def addDefaultWeights(boneList, sknVertices, armatureObj, meshObj, useDeformLayer=None):
+    """Adds an armature modifier and a vertex group per bone to meshObj and
+    fills them with the .skn bone weights.
+
+    Weights are written either with one vertex_groups add call per run of
+    vertices sharing a bone and weight, or straight into the bmesh deform
+    layer.  useDeformLayer=None picks the deform layer when the runs are
+    short, which is the case for ordinary float weights."""
 
     """Add an armature modifier to the mesh"""
     meshObj.modifiers.new(name="Armature", type="ARMATURE")
@@ -507,102 +1077,326 @@ def addDefaultWeights(boneList, sknVertices, armatureObj, meshObj):
     for id, bone in enumerate(boneList):
         meshObj.vertex_groups.new(name=bone.name)
 
+    (vertex, bone, weight) = vertexGroupWeights(sknVertices.boneIndex, sknVertices.weights)
+    if len(bone) and bone.max() >= len(boneList):
+        raise ValueError("Bone index %d out of range for %d bones" % (bone.max(), len(boneList)))
+
+    runStarts = np.flatnonzero(np.diff(bone, prepend=-1) | (np.diff(weight, prepend=np.nan) != 0))
+    if useDeformLayer is None:
+        # an add call costs far more than a deform layer write
+        useDeformLayer = len(runStarts) * 8 > len(bone)
+
+    if useDeformLayer:
+        """
+        Write the weights straight into the bmesh deform layer, which costs
+        no RNA call per weight.  Each vertex's deform data is looked up once.
+        """
+        import bmesh
+
+        order = np.argsort(vertex, kind="stable")
+        (vertex, bone, weight) = (vertex[order], bone[order], weight[order])
+        vertexStarts = np.flatnonzero(np.diff(vertex, prepend=-1)).tolist()
+        vertexEnds = vertexStarts[1:] + [len(vertex)]
+        (vertex, bone, weight) = (vertex.tolist(), bone.tolist(), weight.tolist())
+
+        bm = bmesh.new()
+        bm.from_mesh(meshObj.data)
+        deformLayer = bm.verts.layers.deform.verify()
+        bm.verts.ensure_lookup_table()
+        bmVerts = bm.verts
+        for start, end in zip(vertexStarts, vertexEnds):
+            deformVert = bmVerts[vertex[start]][deformLayer]
+            for k in range(start, end):
+                deformVert[bone[k]] = weight[k]
+        bm.to_mesh(meshObj.data)
+        bm.free()
+        return
+
+    """
+    One add call per run of vertices sharing a bone and weight
     """
-    Loop over vertices by index & add weights
+    runEnds = np.append(runStarts[1:], len(bone))
+    for start, end in zip(runStarts.tolist(), runEnds.tolist()):
+        meshObj.vertex_groups[int(bone[start])].add(vertex[start:end].tolist(), float(weight[start]), "REPLACE")
+
+
+def weldKeys(values, tolerance=None):
+    """Returns integer keys for the rows of a float array.  Without a
+    tolerance the keys are the exact float bits (with -0.0 folded into
+    0.0), otherwise values are snapped to a grid of the given spacing."""
+    values = np.asarray(values, dtype=np.float32)
+    if tolerance:
+        return np.floor(values / tolerance + 0.5).astype(np.int64)
+    return (values + np.float32(0.0)).view(np.int32).astype(np.int64)
+
+
+def weldVertices(positions, texcoords, colors=None, positionTolerance=None, uvTolerance=None, colorTolerance=None):
+    """Merges face loops into unique vertices in one pass.
+
+    Loops are identical when their position, uv and (optional) color
+    match exactly, or fall into the same grid cell when a tolerance is
+    given.  Returns (firstLoop, inverse): vertex k takes its attributes
+    from loop firstLoop[k], and inverse[l] is the vertex of loop l, i.e.
+    the index buffer.  Vertices are numbered in order of first use."""
+    keys = [weldKeys(positions, positionTolerance), weldKeys(texcoords, uvTolerance)]
+    if colors is not None:
+        keys.append(weldKeys(colors, colorTolerance))
+    keys = np.ascontiguousarray(np.column_stack(keys))
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # compare whole rows as opaque byte strings
+    rows = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    (unique, firstLoop, inverse) = np.unique(rows, return_index=True, return_inverse=True)
+
+    # np.unique sorts by key, renumber by first use instead
+    order = np.argsort(firstLoop, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return firstLoop[order], rank[inverse.ravel()]
+
+
+def influenceMatrix(vertex, bone, weight, numVertices):
+    """Scatters flat (vertex, bone, weight) influences into padded
+    (numVertices, K) bone and weight matrices, K being the largest number
+    of influences of any vertex (at least 4).  Unused slots have weight 0."""
+    vertex = np.asarray(vertex, dtype=np.int64)
+    counts = np.bincount(vertex, minlength=numVertices)
+    width = max(4, int(counts.max()) if len(counts) else 0)
+
+    # slot of each influence within its vertex row
+    order = np.argsort(vertex, kind="stable")
+    rowStarts = np.cumsum(counts) - counts
+    slots = np.empty(len(vertex), dtype=np.int64)
+    slots[order] = np.arange(len(vertex)) - np.repeat(rowStarts, counts)
+
+    bones = np.zeros((numVertices, width), dtype=np.int64)
+    weights = np.zeros((numVertices, width), dtype=np.float32)
+    bones[vertex, slots] = bone
+    weights[vertex, slots] = weight
+    return bones, weights
+
+
+def limitInfluences(bones, weights, maxInfluences=4, threshold=0.0, quantize=False):
+    """Keeps the largest maxInfluences weights of every row of padded
+    (N, K) bone/weight matrices and renormalizes them to sum to 1.
+
+    threshold:  weights below this are dropped (the largest one is kept)
+    quantize:   snap weights to multiples of 1/255, keeping the sum at 1
+
+    Returns (N, maxInfluences) uint8 bones and float32 weights sorted by
+    descending weight.  Unused slots get bone 0 and weight 0, rows without
+    any weight stay all zero."""
+    bones = np.asarray(bones)
+    weights = np.asarray(weights, dtype=np.float32)
+    if weights.shape[1] < maxInfluences:
+        padding = ((0, 0), (0, maxInfluences - weights.shape[1]))
+        bones = np.pad(bones, padding)
+        weights = np.pad(weights, padding)
+    if weights.shape[1] > maxInfluences:
+        top = np.argpartition(-weights, maxInfluences - 1, axis=1)[:, :maxInfluences]
+        bones = np.take_along_axis(bones, top, axis=1)
+        weights = np.take_along_axis(weights, top, axis=1)
+
+    order = np.argsort(-weights, axis=1, kind="stable")
+    bones = np.take_along_axis(bones, order, axis=1)
+    weights = np.take_along_axis(weights, order, axis=1)
+
+    if threshold > 0.0:
+        weights[:, 1:][weights[:, 1:] < threshold] = 0.0
+
+    weightSum = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, weightSum, out=np.zeros_like(weights), where=weightSum > 0.0)
+
+    if quantize:
+        steps = np.floor(weights * 255.0 + 0.5)
+        # put the rounding error on the largest weight
+        steps[:, 0] += np.where(weightSum[:, 0] > 0.0, 255.0 - steps.sum(axis=1), 0.0)
+        weights = (steps / 255.0).astype(np.float32)
+
+    bones = np.where(weights > 0.0, bones, 0)
+    if bones.size > 0 and (bones.min() < 0 or bones.max() > 255):
+        raise ValueError("Bone index %d does not fit into a byte" % bones.max())
+    return bones.astype(np.uint8), weights
+
+
+exportData = namedtuple(
+    "exportData",
+    [
+        "positions",
+        "normals",
+        "triVerts",
+        "triLoops",
+        "triMaterials",
+        "loopUvs",
+        "loopColors",
+        "weightVertex",
+        "weightGroup",
+        "weightValue",
+    ],
+)
+
+
+def readLayer(layerData, name, numItems, width):
+    """foreach_get of a per-item float attribute into an (N, width) array"""
+    values = np.empty(numItems * width, dtype=np.float32)
+    layerData.foreach_get(name, values)
+    return values.reshape(-1, width)
+
+
+def extractMesh(meshObj, uvLayerName, colorLayerNames=None, useEvaluated=False):
+    """Reads everything the exporters need from a mesh object in object mode.
+
+    Faces are triangulated through loop_triangles.  With useEvaluated the
+    mesh is taken after modifiers, which also applies the pose of an
+    armature modifier, so skinned meshes are normally read undeformed.
+    colorLayerNames is an optional (color, alpha) pair of vertex color
+    layers; the result's loopColors are RGB from the first and alpha from
+    the red channel of the second.
+
+    Returns an exportData of numpy arrays.  Vertex group weights come as
+    flat (vertex, group, weight) arrays.
     """
-    for vtx_idx, vtx in enumerate(sknVertices):
-        for k in range(4):
-            boneId = vtx.boneIndex[k]
-            weight = vtx.weights[k]
+    import bpy
 
-            meshObj.vertex_groups[boneId].add([vtx_idx], weight, "ADD")
+    if meshObj.mode == "EDIT":
+        meshObj.update_from_editmode()
 
+    if useEvaluated:
+        evaluatedObj = meshObj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+        mesh = evaluatedObj.to_mesh()
+    else:
+        mesh = meshObj.data
+
+    try:
+        numVerts = len(mesh.vertices)
+        numLoops = len(mesh.loops)
+        mesh.calc_loop_triangles()
+        numTris = len(mesh.loop_triangles)
+
+        positions = readLayer(mesh.vertices, "co", numVerts, 3)
+        normals = readLayer(mesh.vertices, "normal", numVerts, 3)
+
+        triVerts = np.empty(numTris * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("vertices", triVerts)
+        triLoops = np.empty(numTris * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("loops", triLoops)
+        triMaterials = np.empty(numTris, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("material_index", triMaterials)
+
+        loopUvs = readLayer(mesh.uv_layers[uvLayerName].data, "uv", numLoops, 2)
+        if colorLayerNames is not None:
+            loopColors = readLayer(mesh.vertex_colors[colorLayerNames[0]].data, "color", numLoops, 4)
+            loopColors[:, 3] = readLayer(mesh.vertex_colors[colorLayerNames[1]].data, "color", numLoops, 4)[:, 0]
+        else:
+            loopColors = None
+
+        # there is no foreach access to deform weights, so flatten them in
+        # one pass over the vertices
+        groupCounts = np.array([len(v.groups) for v in mesh.vertices], dtype=np.int64)
+        groupItems = np.array(
+            [(g.group, g.weight) for v in mesh.vertices for g in v.groups], dtype=np.float64
+        ).reshape(-1, 2)
+        weightVertex = np.repeat(np.arange(numVerts, dtype=np.int64), groupCounts)
+        weightGroup = groupItems[:, 0].astype(np.int64)
+        weightValue = groupItems[:, 1]
+    finally:
+        if useEvaluated:
+            evaluatedObj.to_mesh_clear()
+
+    return exportData(
+        positions,
+        normals,
+        triVerts.reshape(-1, 3),
+        triLoops.reshape(-1, 3),
+        triMaterials,
+        loopUvs,
+        loopColors,
+        weightVertex,
+        weightGroup,
+        weightValue,
+    )
 
-def exportSKN(meshObj, output_filepath, input_filepath, BASE_ON_IMPORT, VERSION):
-    import bpy
-    import bmesh
 
+def exportSKN(
+    meshObj,
+    output_filepath,
+    input_filepath,
+    BASE_ON_IMPORT,
+    VERSION,
+    USE_32BIT_INDICES=False,
+    POSITION_TOLERANCE=None,
+    UV_TOLERANCE=None,
+    WEIGHT_THRESHOLD=0.0,
+    QUANTIZE_WEIGHTS=False,
+    OPTIMIZE_VERTEX_CACHE=False,
+    APPLY_MODIFIERS=False,
+):
     if VERSION not in [1, 2, 4] and not BASE_ON_IMPORT:
         raise ValueError("Version %d not supported! Try versions 1, 2, or 4" % VERSION)
 
-    # Go into object mode & select only the mesh
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-    meshObj.select_set(True)
+    # Read the mesh data in object mode, without selection changes
     containsVertexColor = ("lolVertexColor" in meshObj.data.vertex_colors) and (
         "lolVertexColorAlpha" in meshObj.data.vertex_colors
     )
+    data = extractMesh(
+        meshObj,
+        "lolUVtex",
+        ("lolVertexColor", "lolVertexColorAlpha") if containsVertexColor else None,
+        APPLY_MODIFIERS,
+    )
+    vertNormals = data.normals
+
+    # Group the triangles by material with a stable sort, so each material's
+    # triangles keep their order.  Faces without a material slot are dropped
+    numMaterials = len(meshObj.material_slots)
+    faces = np.flatnonzero(data.triMaterials < numMaterials)
+    faces = faces[np.argsort(data.triMaterials[faces], kind="stable")]
+    faceLoops = data.triLoops[faces].ravel()
+    matLoopCounts = 3 * np.bincount(data.triMaterials[faces], minlength=numMaterials)
+    matLoopStarts = (np.cumsum(matLoopCounts) - matLoopCounts).tolist()
+
+    # Per-loop data, grouped by material
+    loopVerts = data.triVerts[faces].ravel().astype(np.int64)
+    loopPositions = data.positions[loopVerts]
+    loopUvs = data.loopUvs[faceLoops]
+    if containsVertexColor:
+        loopColors = data.loopColors[faceLoops]
+    else:
+        loopColors = None
 
-    # Build vertex data lists and dictionary of vertex-uv pairs
-    vertexUvs = OrderedDict()
-    vertices = []
-    vertexNormals = []
-    vertexWeights = []
-    vtxColors = []
-    indices = []
-
-    # Read materials
-    matHeaders = []
+    # every loop with unique uv, position or color exports as unique vertex
+    (firstLoop, indices) = weldVertices(loopPositions, loopUvs, loopColors, POSITION_TOLERANCE, UV_TOLERANCE)
+    matLoopEnds = matLoopStarts[1:] + [len(loopVerts)]
 
-    bpy.ops.object.mode_set(mode="EDIT")
+    if OPTIMIZE_VERTEX_CACHE:
+        print("ACMR before optimization: %f" % lolVertexCache.acmr(indices))
+        for matStart, matEnd in zip(matLoopStarts, matLoopEnds):
+            indices[matStart:matEnd] = lolVertexCache.optimizeTriangles(indices[matStart:matEnd])
+        (indices, order) = lolVertexCache.optimizeVertexFetch(indices, len(firstLoop))
+        firstLoop = firstLoop[order]
+        print("ACMR after optimization: %f" % lolVertexCache.acmr(indices))
 
-    bm = bmesh.from_edit_mesh(meshObj.data)
-    bm.verts.ensure_lookup_table()
-    bm.verts.index_update()
-    bm.faces.index_update()
-    for f in bm.faces:
-        for l in f.loops:
-            l.index = -1
-
-    # bmesh data layers
-    weightLayer = bm.verts.layers.deform.active
-    uvLayer = bm.loops.layers.uv["lolUVtex"]
-    if containsVertexColor:
-        vertexColorLayer = bm.loops.layers.color["lolVertexColor"]
-        vertexColorAlphaLayer = bm.loops.layers.color["lolVertexColorAlpha"]
+    vertices = loopPositions[firstLoop]
+    vertexNormals = vertNormals[loopVerts[firstLoop]]
 
+    # vertices are numbered in first-use order, so each material owns the
+    # contiguous range of vertices first used by its index range
+    matHeaders = []
+    firstUse = np.unique(indices, return_index=True)[1]
+    matStartVerts = np.searchsorted(firstUse, matLoopStarts)
+    matEndVerts = np.searchsorted(firstUse, matLoopEnds)
     for m, matSlot in enumerate(meshObj.material_slots):
-        bpy.ops.mesh.select_all(action="DESELECT")
-        bpy.context.active_object.active_material_index = m
-        bpy.ops.object.material_slot_select()
-
-        matStartVert = len(vertices)
-        matStartIndex = len(indices)
+        matHeaders.append(
+            sknMaterial(
+                matSlot.material.name,
+                int(matStartVerts[m]),
+                int(matEndVerts[m] - matStartVerts[m]),
+                matLoopStarts[m],
+                matLoopEnds[m] - matLoopStarts[m],
+            )
+        )
 
-        for f in bm.faces:
-            if f.select == True:
-                # check if the face is a triangle
-                if len(f.verts) != 3:
-                    raise ValueError("Found a face which is not a triangle. Every face has to be a triangle!")
-
-                for loop in f.loops:
-                    # every vertex should have one uv coordinate -> every loop with unique uv or vert coordinate exports as unique vertex
-                    loopId = loop[uvLayer].uv[:] + loop.vert.co[:]
-                    if loopId not in vertexUvs:
-                        loop.index = len(vertices)
-                        vertices.append(loop.vert.co[:])
-                        vertexNormals.append(loop.vert.normal[:])
-                        vertexWeights.append(loop.vert[weightLayer].items())
-                        vertexUvs[loopId] = loop.index
-                        if containsVertexColor:
-                            vtxColor = loop[vertexColorLayer][0:3]
-                            vtxColorAlpha = loop[vertexColorAlphaLayer][:1]
-                            # append alpha value from different layer
-                            vtxColor = vtxColor + vtxColorAlpha
-                            vtxColors.append(vtxColor)
-
-                    indices.append(vertexUvs[loopId])
-
-        indexCount = len(indices) - matStartIndex
-        vertCount = len(vertices) - matStartVert
-        matHeaders.append(sknMaterial(matSlot.material.name, matStartVert, vertCount, matStartIndex, indexCount))
-
-    bm.free()
-    bpy.ops.mesh.select_all(action="DESELECT")
-    bpy.ops.object.mode_set(mode="OBJECT")
-
-    vertexUvs = list(vertexUvs.keys())
-    numMats = len(meshObj.material_slots)
     numIndices = len(indices)
     numVertices = len(vertices)
 
@@ -611,29 +1405,21 @@ def exportSKN(meshObj, output_filepath, input_filepath, BASE_ON_IMPORT, VERSION)
     else:
         vertexBlockSize = 52
 
-    boundingBoxMin = meshObj.bound_box[0][0:3]
-    boundingBoxMax = meshObj.bound_box[6][0:3]
-
-    # approximate bounding sphere
-    sphereCenter = (
-        (boundingBoxMax[0] + boundingBoxMin[0]) * 0.5,
-        (boundingBoxMax[1] + boundingBoxMin[1]) * 0.5,
-        (boundingBoxMax[2] + boundingBoxMin[2]) * 0.5,
-    )
-
-    maxDistance = 0.0
-    for i in range(3):
-        distance = sphereCenter[i] - boundingBoxMin[i]
-        if distance > maxDistance:
-            maxDistance = distance
-
-    boundingSpherePos = sphereCenter
-    boundingSphereRadius = maxDistance
+    # bounds of the exported vertices, not of Blender's bound_box
+    bounds = lolBounds.computeBounds(vertices)
+    boundingBoxMin = bounds.boxMin.tolist()
+    boundingBoxMax = bounds.boxMax.tolist()
+    boundingSpherePos = bounds.sphereCenter.tolist()
+    # round the radius up, so the float32 stored sphere still contains every vertex
+    boundingSphereRadius = np.float32(bounds.sphereRadius)
+    if float(boundingSphereRadius) < bounds.sphereRadius:
+        boundingSphereRadius = np.nextafter(boundingSphereRadius, np.float32(np.inf))
+    boundingSphereRadius = float(boundingSphereRadius)
 
     # Write header block
     if BASE_ON_IMPORT:
-        (import_header, import_mats, import_meta_data, import_indices, import_vertices) = importSKN(input_filepath)
-        header = import_header
+        # the cached header is shared, so copy it before it is changed
+        header = copy.copy(lolCache.cachedParse(input_filepath, readSKNHeader))
         VERSION = header.version
     else:
         header = sknHeader()
@@ -641,6 +1427,10 @@ def exportSKN(meshObj, output_filepath, input_filepath, BASE_ON_IMPORT, VERSION)
         header.version = VERSION
         header.numObjects = 1
 
+    # fail before the output file is touched
+    indexSize = 4 if USE_32BIT_INDICES else 2
+    checkIndexSize(indexSize, VERSION, numVertices)
+
     meta_data = sknMetaData(
         0,
         numIndices,
@@ -651,87 +1441,44 @@ def exportSKN(meshObj, output_filepath, input_filepath, BASE_ON_IMPORT, VERSION)
         boundingBoxMax,
         boundingSpherePos,
         boundingSphereRadius,
+        indexSize,
     )
 
-    # create output file
-    sknFid = open(output_filepath, "wb")
-
-    # write header
-    header.numMaterials = numMats
-    header.toFile(sknFid)
-    if header.numObjects > 0:  # if materials exist
-        # We are writing a materials block
-        for mat in matHeaders:
-            mat.toFile(sknFid)
-
-    meta_data.toFile(sknFid, VERSION)
-
-    # write face indices
-    for idx in indices:
-        buf = struct.pack("<h", idx)
-        sknFid.write(buf)
-
-    # Write vertices
-    sknVtx = sknVertex()
-    for idx, vtx in enumerate(vertices):
-        sknVtx.reset()
-        # get position
-        sknVtx.position[0] = vtx[0]
-        sknVtx.position[1] = vtx[1]
-        sknVtx.position[2] = vtx[2]
-
-        sknVtx.normal[0] = vertexNormals[idx][0]
-        sknVtx.normal[1] = vertexNormals[idx][1]
-        sknVtx.normal[2] = vertexNormals[idx][2]
-
-        # get weights
-        # The SKN format only allows 4 bone weights,
-        # so we'll choose the largest 4 & renormalize
-        # if needed
-        vtxWeights = vertexWeights[idx]
-        if len(vtxWeights) > 4:
-            # Sort by weight in decending order
-            vtxWeights = sorted(vtxWeights, key=lambda t: t[1], reverse=True)
-
-            # Find sum of four largets weights.
-            tmpSum = 0
-            for k in range(4):
-                tmpSum += vtxWeights[k][1]
-
-            # Spread remaining weight proportionally across bones
-            remWeight = 1 - tmpSum
-            for k in range(4):
-                sknVtx.boneIndex[k] = vtxWeights[k][0]
-                sknVtx.weights[k] = vtxWeights[k][1] + vtxWeights[k][1] * remWeight / tmpSum
-
-        else:
-            # If we have 4 or fewer bone/weight associations,
-            # we have to ensure that the sum of the weights is 1
-            weightSum = 0.0
-            for group, weight in vtxWeights:
-                weightSum += weight
-
-            for vtxIdx, (group, weight) in enumerate(vtxWeights):
-                sknVtx.boneIndex[vtxIdx] = group
-                sknVtx.weights[vtxIdx] = weight / weightSum
-
-        # Get UV's
-        sknVtx.texcoords[0] = vertexUvs[idx][0]
-        sknVtx.texcoords[1] = 1 - vertexUvs[idx][1]  # flip y-coordinates
-
-        if containsVertexColor:
-            sknVtx.vertexColor = vtxColors[idx]
+    # The SKN format only allows 4 bone weights,
+    # so we'll choose the largest 4 & renormalize
+    (vertBones, vertBoneWeights) = influenceMatrix(
+        data.weightVertex, data.weightGroup, data.weightValue, len(data.positions)
+    )
+    (vertBones, vertBoneWeights) = limitInfluences(vertBones, vertBoneWeights, 4, WEIGHT_THRESHOLD, QUANTIZE_WEIGHTS)
+    boneIndex = vertBones[loopVerts[firstLoop]]
+    weights = vertBoneWeights[loopVerts[firstLoop]]
 
-        # writeout the vertex
-        sknVtx.toFile(sknFid, containsVertexColor)
+    # Get UV's, flipping y-coordinates
+    texcoords = loopUvs[firstLoop]
+    texcoords[:, 1] = 1 - texcoords[:, 1]
 
-    if VERSION >= 2:  # some extra ints in v2+. not sure what they do, non-0 in v4?
-        if header.endTab is None or len(header.endTab) < 3:
-            header.endTab = [0, 0, 0]
-        sknFid.write(struct.pack("<3i", header.endTab[0], header.endTab[1], header.endTab[2]))
+    if containsVertexColor:
+        vertexColor = (loopColors[firstLoop] * 255.0).astype(np.uint8)
+    else:
+        vertexColor = None
+
+    mesh = sknMesh(
+        header,
+        matHeaders,
+        meta_data,
+        indices,
+        vertices,
+        boneIndex,
+        weights,
+        vertexNormals,
+        texcoords,
+        vertexColor,
+    )
+    writeSKN(output_filepath, mesh)
 
-    # Close the output file
-    sknFid.close()
+    # the file only stores the whole mesh bounds; the per material ones are
+    # returned for callers that index or cull by material
+    return bounds, lolBounds.materialBounds(vertices, indices, matHeaders)
 
 
 def importSCO(filename):
@@ -889,101 +1636,37 @@ def buildSCO(filename):
         mesh.update()
 
 
-def exportSCO(meshObj, output_filepath):
-    import bpy
-    import mathutils
-    import bmesh
-
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-    meshObj.select_set(True)
-    mesh = meshObj.data
+def exportSCO(meshObj, output_filepath, APPLY_MODIFIERS=False):
+    data = extractMesh(meshObj, "scoUVtex", None, APPLY_MODIFIERS)
 
     scoName = meshObj.name
-    vertCount = len(mesh.vertices)
-
-    vertexList = []
-
-    centralpoint = mathutils.Vector([0, 0, 0])
-    for vert in mesh.vertices:
-        vertexList.append(vert.co.copy())
-        centralpoint += vert.co
-    centralpoint /= vertCount
-    print(vertexList[0])
-    bpy.ops.object.mode_set(mode="EDIT")
-    bm = bmesh.from_edit_mesh(mesh)
-
-    faceCount = len(bm.faces)
-
-    faceList = []
-    materialDict = {}
-    uvList = [None] * faceCount
-
-    uvLayer = bm.loops.layers.uv["scoUVtex"]
-    for m, matSlot in enumerate(meshObj.material_slots):
-        bpy.ops.mesh.select_all(action="DESELECT")
-        bpy.context.active_object.active_material_index = m
-        bpy.ops.object.material_slot_select()
+    vertCount = len(data.positions)
+    centralpoint = data.positions.mean(axis=0) if vertCount else np.zeros(3)
+
+    # faces grouped by material in slot order, uvs flipped
+    materialNames = [matSlot.material.name for matSlot in meshObj.material_slots]
+    faces = np.flatnonzero(data.triMaterials < len(materialNames))
+    faces = faces[np.argsort(data.triMaterials[faces], kind="stable")]
+    faceUvs = data.loopUvs[data.triLoops[faces]]
+    faceUvs[:, :, 1] = 1 - faceUvs[:, :, 1]
+
+    lines = ["[ObjectBegin]\n"]
+    lines.append("Name= " + scoName + "\n")
+    lines.append("CentralPoint= {:.4f} {:.4f} {:.4f}\n".format(*centralpoint))
+    lines.append("Verts= " + str(vertCount) + "\n")
+    lines.extend("{:.4f} {:.4f} {:.4f}\n".format(*vert) for vert in data.positions.tolist())
+
+    lines.append("Faces= " + str(len(faces)) + "\n")
+    for f, uvs, m in zip(data.triVerts[faces].tolist(), faceUvs.tolist(), data.triMaterials[faces].tolist()):
+        lines.append(
+            "3\t{:4d}{:5d}{:5d}\t{:20}\t".format(f[0], f[1], f[2], materialNames[m])
+            + " ".join("{:.12f} {:.12f}".format(u, v) for u, v in uvs)
+            + "\n"
+        )
+    lines.append("[ObjectEnd]\n\n")
 
-        for f in bm.faces:
-            if f.select == True:
-                materialDict.setdefault(matSlot.material.name, []).append(f.index)
-
-                faceList.append([])
-
-                uvList[f.index] = []
-                for loop in f.loops:
-                    faceList[-1].append(loop.vert.index)
-                    uvList[f.index].append(loop[uvLayer].uv.copy())
-                    uvList[f.index][-1][1] = 1 - uvList[f.index][-1][1]
-
-    bm.free()
-    bpy.ops.mesh.select_all(action="DESELECT")
-    bpy.ops.object.mode_set(mode="OBJECT")
-
-    scoFid = open(output_filepath, "w")
-
-    scoFid.write("[ObjectBegin]\n")
-
-    scoFid.write("Name= " + scoName + "\n")
-    scoFid.write(
-        "CentralPoint= "
-        + "{:.4f}".format(centralpoint[0])
-        + " "
-        + "{:.4f}".format(centralpoint[1])
-        + " "
-        + "{:.4f}".format(centralpoint[2])
-        + "\n"
-    )
-    scoFid.write("Verts= " + str(vertCount) + "\n")
-    print(vertexList[0])
-    print(vertexList[0][1])
-    print("{:.4f}".format(vertexList[0][1]))
-    for vert in vertexList:
-        scoFid.write("{:.4f}".format(vert[0]) + " " + "{:.4f}".format(vert[1]) + " " + "{:.4f}".format(vert[2]) + "\n")
-
-    scoFid.write("Faces= " + str(faceCount) + "\n")
-    for matName in materialDict.keys():
-        faces = []
-        for fIndex in materialDict[matName]:
-            faces.append(faceList[fIndex])
-        for fIndex, f in enumerate(faces):
-            indexCount = len(f)
-            scoFid.write(str(indexCount) + "	")
-
-            scoFid.write("{:4d}".format(f[0]))
-            for i in range(1, indexCount, 1):
-                scoFid.write("{:5d}".format(f[i]))
-            scoFid.write("	")
-            scoFid.write("{:20}".format(matName))
-            scoFid.write("	")
-            for i, uvs in enumerate(uvList[fIndex]):
-                if i != 0:
-                    scoFid.write(" ")
-                scoFid.write("{:.12f}".format(uvs[0]) + " " + "{:.12f}".format(uvs[1]))
-            scoFid.write("\n")
-
-    scoFid.write("[ObjectEnd]\n\n")
+    with open(output_filepath, "w") as scoFid:
+        scoFid.write("".join(lines))
 
 
 if __name__ == "__main__":
@@ -16,8 +16,14 @@
 # ##### END GPL LICENSE BLOCK #####
 
 # <pep8 compliant>
+import copy
+import os
 import struct
-import mathutils
+from collections import namedtuple
+
+import numpy as np
+
+from . import lolCache, lolMath
 
 class sklHeader():
     """LoL skeleton header format:
@@ -159,7 +165,7 @@ class sklBone():
             self.position = list(fields[6:9])
             self.position[2] *= -1. # make z negative
             self.scale = fields[9:12]
-            self.quat = mathutils.Quaternion([
+            self.quat = np.array([
                     - fields[15], fields[12], fields[13],
                     - fields[14]])
             # self.matrix = self.quat.to_matrix()
@@ -205,10 +211,316 @@ class sklBone():
         return newBone
 
 
-def importSKL(filepath):
+# Packed bone records, see sklBone
+sklBoneDtypeV12 = np.dtype([
+        ("name", "S32"),
+        ("parent", "<i4"),
+        ("scale", "<f4"),
+        ("matrix", "<f4", (3, 4)),
+        ])
+sklBoneDtypeV0 = np.dtype([
+        ("zero", "<i2"),
+        ("id", "<i2"),
+        ("parent", "<i2"),
+        ("unknown", "<i2"),
+        ("nameHash", "<i4"),
+        ("twopointone", "<f4"),
+        ("position", "<f4", (3,)),
+        ("scale", "<f4", (3,)),
+        ("quat", "<f4", (4,)),
+        ("ct", "<f4", (3,)),
+        ("extra", "<f4", (8,)),
+        ])
+
+# z is flipped on import: the last matrix row, position z and ct y, z
+matrixFlip = np.array([[1.], [1.], [-1.]], dtype=np.float32)
+positionFlip = np.array([1., 1., -1.], dtype=np.float32)
+ctFlip = np.array([1., -1., -1.], dtype=np.float32)
+
+
+def readBones(sklFid, dtype, numBones):
+    """Reads numBones packed bone records with a single read"""
+    buf = bytearray(numBones * dtype.itemsize)
+    if sklFid.readinto(buf) != len(buf):
+        raise ValueError("Unexpected end of file while reading %d bones" % numBones)
+    return np.frombuffer(buf, dtype=dtype)
+
+
+def readTable(sklFid, dtype, count):
+    """Reads count values of dtype with a single read"""
+    dtype = np.dtype(dtype)
+    buf = sklFid.read(count * dtype.itemsize)
+    if len(buf) != count * dtype.itemsize:
+        raise ValueError("Unexpected end of file while reading %d values" % count)
+    return np.frombuffer(buf, dtype=dtype)
+
+
+def splitStringTable(table, count):
+    """Splits the first count names out of a v0 string table.  Names are
+    NUL terminated and each one starts on a 4 byte boundary."""
+    names = []
+    start = 0
+    for i in range(count):
+        end = table.find(b'\0', start)
+        if end < 0:
+            raise ValueError("Unterminated bone name in string table")
+        names.append(table[start:end].decode())
+        start = (end // 4 + 1) * 4
+    return names
+
+
+class sklHierarchy():
+    """Parent/child index of a skeleton, computed once from the parent array.
+
+    parents     int64   (N,)    -1 for root bones
+    levels      int64   (N,)    depth below the root, roots are 0
+    order       int64   (N,)    bones sorted by level, so parents come
+                                before their children
+    levelGroups list of the bone index arrays of each level
+    children    list of each bone's child index array
+    roots       int64   (R,)
+
+    Transforms are propagated one level at a time with batched matrix
+    products, so the Python work is O(depth) instead of O(bones).
+    """
+
+    def __init__(self, parents):
+        parents = np.asarray(parents, dtype=np.int64)
+        numBones = len(parents)
+        if numBones and (parents.min() < -1 or parents.max() >= numBones):
+            raise ValueError("Parent index out of range for %d bones" % numBones)
+
+        levels = np.where(parents == -1, 0, -1)
+        safeParents = np.maximum(parents, 0)
+        for depth in range(numBones):
+            found = (levels == -1) & (levels[safeParents] == depth) & (parents >= 0)
+            if not found.any():
+                break
+            levels[found] = depth + 1
+        if (levels == -1).any():
+            raise ValueError("Bone %d is part of a parent cycle" % np.flatnonzero(levels == -1)[0])
+
+        self.parents = parents
+        self.levels = levels
+        self.order = np.argsort(levels, kind="stable")
+        levelCounts = np.bincount(levels, minlength=1)
+        self.levelGroups = np.split(self.order, np.cumsum(levelCounts)[:-1])
+        childCounts = np.bincount(parents + 1, minlength=numBones + 1)
+        childGroups = np.split(np.argsort(parents, kind="stable"), np.cumsum(childCounts)[:-1])
+        self.roots = childGroups[0]
+        self.children = childGroups[1:]
+
+    def __len__(self):
+        return len(self.parents)
+
+    def toModel(self, localMatrices):
+        """(N, 4, 4) bone to model space matrices from parent relative ones"""
+        model = np.array(localMatrices, dtype=np.float64)
+        for group in self.levelGroups[1:]:
+            model[group] = model[self.parents[group]] @ model[group]
+        return model
+
+    def toLocal(self, modelMatrices):
+        """(N, 4, 4) parent relative matrices from model space ones"""
+        modelMatrices = np.asarray(modelMatrices, dtype=np.float64)
+        local = modelMatrices.copy()
+        children = np.flatnonzero(self.parents >= 0)
+        local[children] = lolMath.invertAffine(modelMatrices[self.parents[children]]) @ modelMatrices[children]
+        return local
+
+    def parentOffsets(self, matrices, heads):
+        """Rest offsets used to convert between pose and animation space.
+
+        From model space (N, 4, 4) matrices and (N, 3) heads returns
+        offsets, the head relative to the parent's head in the bone's own
+        axes, and rotations (w, x, y, z) relative to the parent.  Roots are
+        relative to the origin and the identity."""
+        matrices = np.asarray(matrices, dtype=np.float64)
+        heads = np.asarray(heads, dtype=np.float64)
+        hasParent = (self.parents >= 0)[:, np.newaxis]
+        safeParents = np.maximum(self.parents, 0)
+
+        delta = heads - np.where(hasParent, heads[safeParents], 0.0)
+        offsets = np.einsum("ni,nij->nj", delta, matrices[:, :3, :3])
+
+        quats = lolMath.matrixToQuat(matrices)
+        parentQuats = np.where(hasParent, quats[safeParents], np.array([1.0, 0.0, 0.0, 0.0]))
+        rotations = lolMath.quatMultiply(lolMath.quatInverse(parentQuats), quats)
+        return offsets, rotations
+
+
+class sklBoneView():
+    """Bone-like view of one row of a sklSkeleton, for code written against
+    lists of sklBone"""
+
+    __slots__ = ('skeleton', 'index')
+
+    def __init__(self, skeleton, index):
+        self.skeleton = skeleton
+        self.index = index
+
+    @property
+    def name(self):
+        return self.skeleton.names[self.index]
+
+    @property
+    def parent(self):
+        return int(self.skeleton.parents[self.index])
+
+    @property
+    def scale(self):
+        return self.skeleton.scales[self.index]
+
+    @property
+    def matrix(self):
+        return self.skeleton.matrices[self.index]
+
+    @property
+    def id(self):
+        return int(self.skeleton.ids[self.index])
+
+    @property
+    def position(self):
+        return self.skeleton.positions[self.index]
+
+    @property
+    def quat(self):
+        return self.skeleton.quats[self.index]
+
+    @property
+    def ct(self):
+        return self.skeleton.ct[self.index]
+
+    @property
+    def extra(self):
+        return self.skeleton.extra[self.index]
+
+
+class sklSkeleton():
+    """Columnar skeleton, one array per bone attribute.
+
+    all versions
+    names       list of str
+    parents     int32   (N,)        -1 for root bones
+    boneIDs     int32   (M,)        reordered bone list, empty for v1
+
+    v1-2
+    scales      float32 (N,)
+    matrices    float32 (N, 3, 4)   affine bone matrix, z flipped
+
+    v0
+    ids         int32   (N,)
+    nameHashes  int32   (N,)
+    positions   float32 (N, 3)      z flipped
+    scales      float32 (N, 3)
+    quats       float32 (N, 4)      w, x, y, z in blender's frame
+    ct          float32 (N, 3)      y and z flipped
+    extra       float32 (N, 8)
+
+    The skeleton is also a sequence of sklBoneView.
+
+    hierarchy, bindMatrices and inverseBindMatrices are computed on first
+    use and kept, so treat the columns as read-only after that.
+    """
+
+    __slots__ = ('header', 'names', 'parents', 'boneIDs', 'scales',
+            'matrices', 'ids', 'nameHashes', 'positions', 'quats', 'ct',
+            'extra', '_hierarchy', '_bindMatrices', '_inverseBindMatrices')
+
+    def __init__(self, header=None):
+        self.header = header
+        self.names = []
+        self.parents = np.zeros(0, dtype=np.int32)
+        self.boneIDs = np.zeros(0, dtype=np.int32)
+        for name in ('scales', 'matrices', 'ids', 'nameHashes', 'positions',
+                'quats', 'ct', 'extra', '_hierarchy', '_bindMatrices',
+                '_inverseBindMatrices'):
+            setattr(self, name, None)
+
+    @property
+    def hierarchy(self):
+        if self._hierarchy is None:
+            self._hierarchy = sklHierarchy(self.parents)
+        return self._hierarchy
+
+    @property
+    def bindMatrices(self):
+        """(N, 4, 4) bone to model space rest matrices.  v1-2 files store
+        them directly, v0 bones are a rotation and a position relative to
+        the parent."""
+        if self._bindMatrices is None:
+            if self.matrices is not None:
+                self._bindMatrices = lolMath.composeAffine()[np.newaxis].repeat(len(self), 0)
+                self._bindMatrices[:, :3, :] = self.matrices
+            else:
+                self._bindMatrices = self.hierarchy.toModel(
+                        lolMath.composeAffine(self.quats, self.positions))
+        return self._bindMatrices
+
+    @property
+    def inverseBindMatrices(self):
+        if self._inverseBindMatrices is None:
+            self._inverseBindMatrices = lolMath.invertAffine(self.bindMatrices)
+        return self._inverseBindMatrices
+
+    def fromRecords(self, bones, version):
+        """Fills the columns from a structured array of bone records"""
+        if version in [1, 2]:
+            self.names = [bytes.decode(name).rstrip('\0')
+                    for name in bones['name'].tolist()]
+            self.parents = bones['parent'].astype(np.int32)
+            self.scales = bones['scale'].copy()
+            self.matrices = bones['matrix'] * matrixFlip
+        elif version == 0:
+            # named from the string table later
+            self.names = [str(h) for h in bones['nameHash'].tolist()]
+            self.ids = bones['id'].astype(np.int32)
+            self.parents = bones['parent'].astype(np.int32)
+            self.nameHashes = bones['nameHash'].copy()
+            self.positions = bones['position'] * positionFlip
+            self.scales = bones['scale'].copy()
+            quats = bones['quat']
+            self.quats = np.column_stack((-quats[:, 3], quats[:, 0],
+                    quats[:, 1], -quats[:, 2]))
+            self.ct = bones['ct'] * ctFlip
+            self.extra = bones['extra'].copy()
+        else:
+            raise ValueError('unhandled version number', version)
+
+    def take(self, ids):
+        """Returns a new skeleton of the bones ids, in that order"""
+        ids = np.asarray(ids, dtype=np.int64)
+        skeleton = sklSkeleton(self.header)
+        skeleton.names = [self.names[k] for k in ids.tolist()]
+        skeleton.parents = self.parents[ids]
+        for name in ('scales', 'matrices', 'ids', 'nameHashes', 'positions',
+                'quats', 'ct', 'extra'):
+            column = getattr(self, name)
+            if column is not None:
+                setattr(skeleton, name, column[ids])
+        return skeleton
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [sklBoneView(self, k) for k in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("bone index out of range")
+        return sklBoneView(self, index)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield sklBoneView(self, k)
+
+
+def readSKL(filepath):
+    """Reads a .skl file into a sklSkeleton"""
     header = sklHeader()
-    boneList= []
-    reorderedBoneList = []
+    skeleton = sklSkeleton(header)
     
     #Wrap open in try block
     sklFid = open(filepath, 'rb')
@@ -218,89 +530,130 @@ def importSKL(filepath):
     print("SKL version:%s" % header.version)
     if header.version in [1, 2]:
         #Read in the bones
-        for k in range(header.numBones):
-            boneList.append(sklBone())
-            boneList[k].fromFile(sklFid, header.version)
-        
-
+        skeleton.fromRecords(readBones(sklFid, sklBoneDtypeV12,
+                header.numBones), header.version)
 
         if header.version == 2:  # version 2 has a reordered bone list
             #Read in reordered bone assignments
             numBoneIDs = struct.unpack('<i', sklFid.read(4))[0]  # clue taken from LolViewer
             print ("reordered list size: %i" % numBoneIDs)
-            for i in range(0, numBoneIDs):
-                buf = sklFid.read(4)
-                if buf == b'':
-                    break
-                else:
-                    boneId = struct.unpack('<i', buf)[0]
-                reorderedBoneList.append(boneList[boneId].copy())
+            buf = sklFid.read(4 * numBoneIDs)
+            skeleton.boneIDs = np.frombuffer(buf, dtype='<i4',
+                    count=len(buf) // 4).astype(np.int32)
             
     elif header.version == 0:
         # taken from c# code from LoLViewer
-        for k in range(header.numBones):
-            boneList.append(sklBone())
-            boneList[k].fromFile(sklFid, header.version)
+        skeleton.fromRecords(readBones(sklFid, sklBoneDtypeV0,
+                header.numBones), header.version)
         print("(off1) from %s to %s" % (sklFid.tell(), header.offset1))
         sklFid.seek(header.offset1)
-        # indices for version 4 animation
-        header.boneIDMap = {}
-        for i in range(0, header.numBones):
-            # 8 bytes
-            sklID, anmID = struct.unpack('<2i', sklFid.read(
-                    struct.calcsize('<2i')))
-            header.boneIDMap[anmID] = sklID
-
+        # indices for version 4 animation, (sklID, anmID) pairs
+        idMap = readTable(sklFid, '<i4', 2 * header.numBones).reshape(-1, 2)
+        header.boneIDMap = dict(zip(idMap[:, 1].tolist(), idMap[:, 0].tolist()))
 
         print("(offstr) from %s to %s" % (sklFid.tell(), header.offsetToStrings))
         sklFid.seek(header.offsetToStrings)
-        for i in range(0, header.numBones):
-            name = []
-            while name.count(b'\0') == 0:
-                for j in range(0,4):
-                    name.append(sklFid.read(1))
-            end = name.index(b'\0')
-            boneList[i].name = ''.join(
-                    v.decode() for v in name[0:end])
-            DEBUG_PRINT = False
-            if DEBUG_PRINT and boneList[i].name.lower() in ['root', 'r_weapon', 'shield',
-                    'l_shield', 'r_shield', 'buffbone_cstm_shield_top',
-                    'buffbone_glb_weapon_1', 'l_hip']:
-                bone = boneList[i]
-                print("%s:" % bone.name)
-                print("p:%s" % bone.position)
-                print("ct:%s" % bone.ct)
-                print("q:%s" % bone.quat)
-                if bone.parent > -1:
-                    tct = mathutils.Vector(bone.ct)
-                    tct.rotate(boneList[bone.parent].quat)
-                    print("tct:%s" % tct)
-
-                print("Mags: p:%f, ct:%f" % (mathutils.Vector(
-                        bone.position).length, mathutils.Vector(
-                        bone.ct).length))
-                # print("ex:%s" % boneList[i].extra)
+        skeleton.names = splitStringTable(sklFid.read(), header.numBones)
 
         # below is technically earlier in file than above
         print("(offani) from %s to %s" % (sklFid.tell(), header.offsetAnimationIndices))
         sklFid.seek(header.offsetAnimationIndices)
-        for i in range(0, header.numBoneIDs):
-            boneId = struct.unpack('<h', sklFid.read(
-                    struct.calcsize('<h')))[0]
-            reorderedBoneList.append(boneList[boneId].copy())
+        skeleton.boneIDs = readTable(sklFid, '<i2', header.numBoneIDs).astype(np.int32)
         print("end: %s" % sklFid.tell())
     else:
         raise ValueError("Version %i not supported" % header.version)
 
     sklFid.close()
-    return header, boneList, reorderedBoneList
+    return skeleton
+
+
+def importSKL(filepath):
+    """Reads a .skl file.  The bone lists are sklSkeletons, which iterate
+    like lists of bones; the reordered list is empty for version 1."""
+    skeleton = readSKL(filepath)
+    return skeleton.header, skeleton, skeleton.take(skeleton.boneIDs)
+
+
+sklProbe = namedtuple(
+    "sklProbe",
+    [
+        "version",
+        "fileType",
+        "skeletonHash",
+        "numBones",
+        "numBoneIDs",
+        "boneOffset",
+        "boneIDOffset",
+        "stringOffset",
+        "expectedSize",
+        "fileSize",
+    ],
+)
+
+
+def probeSKL(filepath):
+    """Reads only the header of a .skl file (plus the 4 byte reordered
+    list size of version 2 files) and returns a sklProbe.
+
+    Version 0 files end in a string table of variable length, so their
+    expectedSize is None."""
+    header = sklHeader()
+    with open(filepath, 'rb') as sklFid:
+        fileSize = os.fstat(sklFid.fileno()).st_size
+        header.fromFile(sklFid)
+        if header.version in [1, 2]:
+            boneOffset = sklFid.tell()
+            boneSize = struct.calcsize('<32sif12f')
+            boneIDOffset = None
+            numBoneIDs = 0
+            expectedSize = boneOffset + header.numBones * boneSize
+            if header.version == 2:
+                sklFid.seek(expectedSize)
+                numBoneIDs = struct.unpack('<i', sklFid.read(4))[0]
+                boneIDOffset = expectedSize + 4
+                expectedSize = boneIDOffset + numBoneIDs * 4
+            return sklProbe(header.version, header.fileType, header.skeletonHash,
+                    header.numBones, numBoneIDs, boneOffset, boneIDOffset, None,
+                    expectedSize, fileSize)
+        elif header.version == 0:
+            return sklProbe(header.version, header.fileType, None,
+                    header.numBones, header.numBoneIDs, header.offsetVertexData,
+                    header.offsetAnimationIndices, header.offsetToStrings,
+                    None, fileSize)
+        else:
+            raise ValueError("Version %i not supported" % header.version)
+
+
+def editBonePose(matrices, length=1.0):
+    """Edit bone heads, tails and rolls of (N, 3+, 4) bone matrices.
+
+    The tail is the head plus length times the matrix y axis.  The roll is
+    the signed angle about that axis from the x axis Blender gives a bone
+    with no roll (vec_roll_to_mat3) to the matrix x axis."""
+    matrices = np.asarray(matrices, dtype=np.float64)
+    heads = matrices[:, :3, 3]
+    yAxes = matrices[:, :3, 1]
+    xAxes = matrices[:, :3, 0]
+    tails = heads + yAxes * length
 
+    norms = np.linalg.norm(yAxes, axis=1, keepdims=True)
+    (x, y, z) = (yAxes / np.where(norms > 0.0, norms, 1.0)).T
+    theta = 1.0 + y
+    # a bone pointing straight down -y has the x axis flipped
+    safe = theta > 1e-6
+    thetaInv = 1.0 / np.where(safe, theta, 1.0)
+    zeroRollX = np.stack((np.where(safe, 1.0 - x * x * thetaInv, -1.0),
+            np.where(safe, -x, 0.0),
+            np.where(safe, -x * z * thetaInv, 0.0)), axis=1)
+
+    sine = (np.cross(zeroRollX, xAxes) * yAxes).sum(axis=1)
+    cosine = (zeroRollX * xAxes).sum(axis=1)
+    rolls = np.arctan2(sine, cosine)
+    return heads, tails, rolls
 
 
 def buildSKL(boneList, version):
     import bpy
-    import math
-    import mathutils
     
     #Create Blender Armature
     bpy.ops.object.armature_add(location=(0,0,0), enter_editmode=True)
@@ -313,91 +666,26 @@ def buildSKL(boneList, version):
     #import the bones
 
     print(len(boneList))
-    # print("%s, p:%s" % (boneName, boneList[bone.parent].name if bone.parent > -1 else None))
 
     if version in [1,2]:
-        for boneID, bone in enumerate(boneList):
-            boneName = bone.name.rstrip('\x00')
-            newBone = arm.edit_bones.new(boneName)
-            
-            boneMatrix = mathutils.Matrix()
-            for x in range(4):
-                for y in range(3):
-                    boneMatrix[y][x] = bone.matrix[y][x]
-            
-            newBone.head = (bone.matrix[0][3], bone.matrix[1][3], bone.matrix[2][3])
-            
-            #rotVector is the y-Axis of the bone
-            rotVector = mathutils.Vector((bone.matrix[0][1], bone.matrix[1][1], bone.matrix[2][1]))
-            newBone.tail = newBone.head + rotVector * 3
-            
-            #calculate the roll of the bone based on the x-Vector the bone has before the roll is applied
-            #and the x-Vector it should have after applying it
-            newRollVec = mathutils.Vector([bone.matrix[0][0], bone.matrix[1][0], bone.matrix[2][0]])
-            oldRollVec = mathutils.Vector([newBone.matrix[0][0], newBone.matrix[1][0], newBone.matrix[2][0]])
-            normal = mathutils.Vector((bone.matrix[0][1], bone.matrix[1][1], bone.matrix[2][1]))
-            
-            #https://stackoverflow.com/questions/5188561/signed-angle-between-two-3d-vectors-with-same-origin-within-the-same-plane
-            roll = math.atan2(oldRollVec.cross(newRollVec) @ normal, oldRollVec @ newRollVec)
-            
-            newBone.roll = roll
-            
-            boneParentID = bone.parent
-            
-            if boneParentID > -1:
-                boneParentName = boneList[boneParentID].name
-                parentBone = arm.edit_bones[boneParentName]
-                newBone.parent = parentBone
-
+        (heads, tails, rolls) = editBonePose(boneList.matrices, 3.0)
     elif version == 0:
-
-        for boneID, bone in enumerate(boneList):
-            #algorithm here based off of above, and LolViewer code
-            #If this bone is a child, find the parent's tail and attach this bone's
-            #head to it
-            parentPos = mathutils.Vector([0,0,0])
-            boneHead = mathutils.Vector(bone.position)
-
-            boneParentID = bone.parent
-            boneName = bone.name.rstrip('\x00')
-            # debug
-            # if boneName.count("weapon"):
-            #     print("prev: %s" % boneList[boneID-1].name)
-            #     print("%s, id:%s\np:%s\nq:%s\ns:%s" % (bone.name, boneID, bone.position, bone.quat, bone.scale))
-            #     print("c%s" % bone.ct)
-            #     # print("E%s" % bone.extra)
-            newBone = arm.edit_bones.new(boneName)
-            if boneParentID > -1:
-                boneParentName = boneList[boneParentID].name
-                parentBone = arm.edit_bones[boneParentName]
-
-                newBone.parent = parentBone
-                parQuat = boneList[boneParentID].quat
-                boneHead.rotate(parQuat)  # only apply parent rotation to self
-                bone.quat = parQuat @ bone.quat  # for children
-
-                # parentPos = mathutils.Vector(boneList[boneParentID].position)
-                parentPos = parentBone.head
-            newBone.head = parentPos + boneHead
-            boneMatrix = bone.quat.to_matrix()
-            newBone.tail = newBone.head + mathutils.Vector([boneMatrix[0][1],boneMatrix[1][1],boneMatrix[2][1]])
-            
-            newRollVec = mathutils.Vector([boneMatrix[0][0], boneMatrix[1][0], boneMatrix[2][0]])
-            oldRollVec = mathutils.Vector([newBone.matrix[0][0], newBone.matrix[1][0], newBone.matrix[2][0]])
-            normal = mathutils.Vector((boneMatrix[0][1], boneMatrix[1][1], boneMatrix[2][1]))
-            #https://stackoverflow.com/questions/5188561/signed-angle-between-two-3d-vectors-with-same-origin-within-the-same-plane
-            roll = math.atan2(oldRollVec.cross(newRollVec) @ normal, oldRollVec @ newRollVec)
-            
-            newBone.roll = roll
-
-        # set bones with children to be average of the
-        # for boneID, bone in enumerate(boneList):
-        #     numChildren = len(children[boneID]['all'])
-        #     if numChildren > 0:
-        #         pos = mathutils.Vector([0,0,0])
-        #         for b in children[boneID]['all']:
-        #             pos += arm.edit_bones[b].head/numChildren
-        #         arm.edit_bones[bone.name].tail = pos
+        # based off of LolViewer code: each bone's position is rotated by
+        # its parent's rotation and attached to the parent's head, which
+        # the bind matrices already do for all bones
+        (heads, tails, rolls) = editBonePose(boneList.bindMatrices)
+    else:
+        raise ValueError("Version %d not supported" % version)
+
+    # create every bone, then place them and link parents by index, so
+    # renamed duplicates still end up under the right parent
+    editBones = [bones.new(name.rstrip('\x00')) for name in boneList.names]
+    bones.foreach_set("head", heads.astype(np.float32).ravel())
+    bones.foreach_set("tail", tails.astype(np.float32).ravel())
+    bones.foreach_set("roll", rolls.astype(np.float32))
+    for boneID, parentID in enumerate(boneList.parents.tolist()):
+        if parentID > -1:
+            editBones[boneID].parent = editBones[parentID]
 
     bpy.ops.object.mode_set(mode='OBJECT')
 
@@ -432,9 +720,9 @@ def exportSKL(meshObj, skelObj, output_filepath, input_filepath):
             bones[-1].matrix[2][k] = -bones[-1].matrix[2][k]
     
     
-    (import_header, import_boneList, import_reorderedBoneList) = importSKL(input_filepath)
+    (import_header, import_boneList, import_reorderedBoneList) = lolCache.cachedParse(input_filepath, importSKL)
     
-    header = import_header
+    header = copy.copy(import_header)  # the cached header is shared
     
     header.numBones = numBones
     
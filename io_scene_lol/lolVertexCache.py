@@ -0,0 +1,143 @@
+# ##### BEGIN GPL LICENSE BLOCK ##### #
+# lolblender - Python addon to use League of Legends files into blender
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Index buffer reordering for the GPU's post-transform vertex cache.
+# Triangle order follows Tom Forsyth's "Linear-Speed Vertex Cache
+# Optimisation" (2006); vertex order is then renumbered by first use so the
+# vertex fetches walk memory forwards.
+
+# <pep8 compliant>
+from collections import deque
+
+import numpy as np
+
+# Forsyth's tuning constants
+CACHE_DECAY_POWER = 1.5
+LAST_TRI_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+
+def acmr(indices, cacheSize=16):
+    """Average cache miss ratio: vertex shader runs per triangle for a FIFO
+    cache of cacheSize entries.  1/2 is ideal for big grids, 3 is worst."""
+    indices = np.asarray(indices).ravel().tolist()
+    if not indices:
+        return 0.0
+
+    cache = deque()
+    cached = set()
+    misses = 0
+    for v in indices:
+        if v not in cached:
+            misses += 1
+            cache.append(v)
+            cached.add(v)
+            if len(cache) > cacheSize:
+                cached.discard(cache.popleft())
+    return misses / (len(indices) // 3)
+
+
+def optimizeTriangles(indices, cacheSize=32):
+    """Returns a copy of a triangle list reordered for vertex cache reuse.
+
+    Greedily emits the triangle with the best score, where each vertex
+    scores higher the more recently it was used (it is likely still
+    cached) and the fewer unemitted triangles it has left (so no lonely
+    triangles are left behind).  Only the triangles touching the simulated
+    cache are rescored after each step."""
+    triangles = np.asarray(indices).reshape(-1, 3)
+    numTris = len(triangles)
+    if numTris == 0:
+        return triangles.ravel().copy()
+
+    # work on a compact local vertex numbering
+    (vertices, local) = np.unique(triangles, return_inverse=True)
+    local = local.reshape(-1, 3)
+    numVerts = len(vertices)
+    valence = np.bincount(local.ravel(), minlength=numVerts)
+
+    # vertex -> remaining triangles
+    triOf = (np.argsort(local.ravel(), kind="stable") // 3).tolist()
+    ends = np.cumsum(valence).tolist()
+    starts = [0] + ends[:-1]
+    vertTris = [set(triOf[starts[v] : ends[v]]) for v in range(numVerts)]
+
+    cacheScore = [LAST_TRI_SCORE] * 3 + [
+        (1.0 - (k - 3) / (cacheSize - 3)) ** CACHE_DECAY_POWER for k in range(3, cacheSize)
+    ]
+    valenceScore = [0.0] + [VALENCE_BOOST_SCALE * n ** -VALENCE_BOOST_POWER for n in range(1, int(valence.max()) + 1)]
+
+    remaining = valence.tolist()
+    vertScore = [valenceScore[n] for n in remaining]
+    localTris = local.tolist()
+    triScore = [vertScore[a] + vertScore[b] + vertScore[c] for a, b, c in localTris]
+    triAdded = [False] * numTris
+
+    cache = []
+    order = []
+    bestTri = max(range(numTris), key=triScore.__getitem__)
+    nextTri = 0
+    for n in range(numTris):
+        if bestTri < 0:
+            # nothing left around the cache, continue in input order
+            while triAdded[nextTri]:
+                nextTri += 1
+            bestTri = nextTri
+
+        order.append(bestTri)
+        triAdded[bestTri] = True
+        tri = localTris[bestTri]
+        for v in tri:
+            remaining[v] -= 1
+            vertTris[v].discard(bestTri)
+
+        # LRU update, the emitted triangle's vertices move to the front
+        newCache = tri + [v for v in cache if v not in tri]
+        cache = newCache[:cacheSize]
+        touched = newCache
+
+        candidates = set()
+        for pos, v in enumerate(touched):
+            score = valenceScore[remaining[v]]
+            if pos < cacheSize:
+                score += cacheScore[pos]
+            delta = score - vertScore[v]
+            vertScore[v] = score
+            for t in vertTris[v]:
+                triScore[t] += delta
+            candidates.update(vertTris[v])
+
+        bestTri = max(candidates, key=triScore.__getitem__) if candidates else -1
+
+    return triangles[order].ravel()
+
+
+def optimizeVertexFetch(indices, numVertices):
+    """Renumbers vertices in order of first use.
+
+    Returns (newIndices, order): order[new] is the old index of each
+    vertex, so every vertex attribute array is reordered with
+    attribute[order].  Unused vertices are kept at the end."""
+    indices = np.asarray(indices).ravel()
+    (used, firstUse) = np.unique(indices, return_index=True)
+    unused = np.setdiff1d(np.arange(numVertices), used)
+    order = np.concatenate((used[np.argsort(firstUse, kind="stable")], unused)).astype(np.int64)
+
+    remap = np.empty(numVertices, dtype=np.int64)
+    remap[order] = np.arange(numVertices)
+    return remap[indices], order